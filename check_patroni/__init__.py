@@ -3,3 +3,6 @@ import logging
 __version__ = "2.2.0"
 
 _log: logging.Logger = logging.getLogger(__name__)
+# the warnings of this logger are displayed in the output of the plugin by
+# nagiosplugin's runtime
+_output: logging.Logger = logging.getLogger("nagiosplugin.check_patroni")
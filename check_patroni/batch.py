@@ -0,0 +1,139 @@
+"""Checks run one after another by a single process.
+
+The requests are read from a stream, one per line, and each one is run like
+a separate invocation of the plugin: its output and exit code are captured
+and the state kept by the process between invocations is reset.
+"""
+
+import io
+import json
+import logging
+import re
+import shlex
+from contextlib import redirect_stdout
+from typing import Any, Dict, List, Optional, Tuple
+
+import click
+import nagiosplugin
+from nagiosplugin.output import Output
+
+from . import _log
+
+# a label, quoted if it holds spaces, and its value
+PERFDATA = re.compile(r"'[^']*'=\S*|\S+")
+
+
+def parse_request(line: str) -> Tuple[Optional[Any], List[str]]:
+    """Get the id and the arguments of a request.
+
+    A request is a command line, a JSON array of arguments or a JSON object
+    with the arguments in "args" and an optional "id" given back with the
+    result. The name of the program is dropped from the arguments.
+
+    >>> parse_request("check_patroni -e https://p1:8008 cluster_node_count -w 3:")
+    (None, ['-e', 'https://p1:8008', 'cluster_node_count', '-w', '3:'])
+    >>> parse_request('["node_is_alive"]')
+    (None, ['node_is_alive'])
+    >>> parse_request('{"id": 7, "args": "cluster_has_leader"}')
+    (7, ['cluster_has_leader'])
+    """
+    request_id = None
+    if line.startswith("{"):
+        request = json.loads(line)
+        if not isinstance(request, dict):
+            raise ValueError("the request must be a JSON object or array")
+        request_id = request.get("id")
+        args = request.get("args", [])
+    elif line.startswith("["):
+        args = json.loads(line)
+    else:
+        args = line
+    if isinstance(args, str):
+        args = shlex.split(args)
+    if not isinstance(args, list) or not all(isinstance(a, str) for a in args):
+        raise ValueError("the arguments must be a string or an array of strings")
+    if args and args[0].rsplit("/", 1)[-1] == "check_patroni":
+        args = args[1:]
+    return request_id, args
+
+
+def parse_perfdata(output: str) -> List[str]:
+    """Get the performance data of a plugin output: those following the '|'
+    of the first line and of the long output.
+
+    >>> parse_perfdata("CLUSTERHASLEADER OK - has a leader | has_leader=1;;@0 'a b'=2\\n")
+    ['has_leader=1;;@0', "'a b'=2"]
+    >>> parse_perfdata("MULTI OK - 2 ok\\nlong output\\n| a=1\\nb=2\\n")
+    ['a=1', 'b=2']
+    """
+    perfdata: List[str] = []
+    long_perfdata = False
+    for i, line in enumerate(output.splitlines()):
+        if long_perfdata:
+            perfdata += PERFDATA.findall(line)
+            continue
+        _, sep, data = line.partition("|")
+        if sep:
+            perfdata += PERFDATA.findall(data)
+            # the lines following the '|' of the long output are perfdata
+            long_perfdata = i > 0
+    return perfdata
+
+
+def unknown(message: str) -> Dict[str, Any]:
+    """The result of a request which can't be run."""
+    return {
+        "exitcode": 3,
+        "output": f"UNKNOWN - {message}\n",
+        "perfdata": [],
+        "error": "",
+    }
+
+
+def reset_runtime() -> None:
+    """Forget the state of the previous invocation kept by nagiosplugin's
+    runtime.
+    """
+    runtime = nagiosplugin.Runtime()
+    runtime.check = None
+    runtime.timeout = None
+    runtime.output = Output(runtime.logchan)
+    runtime.verbose = 1
+
+
+def run_request(command: click.Command, args: List[str]) -> Dict[str, Any]:
+    """Run the command like a separate invocation of the plugin, get its
+    output, performance data and exit code, and the usage error if the
+    arguments are invalid.
+    """
+    reset_runtime()
+    levels = {logger: logger.level for logger in (_log, logging.getLogger("urllib3"))}
+    stdout, error = io.StringIO(), io.StringIO()
+    exitcode: Any = 0
+    try:
+        with redirect_stdout(stdout):
+            try:
+                exitcode = command.main(
+                    args, prog_name="check_patroni", standalone_mode=False
+                )
+            except SystemExit as e:
+                exitcode = e.code
+            except click.ClickException as e:
+                # the usage error click would print on stderr
+                e.show(file=error)
+                exitcode = e.exit_code
+            except click.Abort:
+                exitcode = 1
+    finally:
+        for logger, level in levels.items():
+            logger.setLevel(level)
+    if not isinstance(exitcode, int):
+        # like sys.exit(): None is a success, a message a failure
+        exitcode = 0 if exitcode is None else 1
+    output = stdout.getvalue()
+    return {
+        "exitcode": exitcode,
+        "output": output,
+        "perfdata": parse_perfdata(output),
+        "error": error.getvalue(),
+    }
@@ -0,0 +1,175 @@
+"""Responses of the API shared by the invocations of the plugin.
+
+The cluster wide documents (/cluster and /config) are the same whichever
+endpoint answered them. When several checks run within a few seconds, the
+first one stores its response in the state directory and the others use it
+while it's fresh.
+
+The files are written to a temporary file which is renamed over the previous
+one, so that they can be read without a lock.
+
+The identical queries of concurrent checks are also coalesced: the first
+check sends the query and the others use its response.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import Any, Callable, List, Optional
+
+import attr
+
+from . import _log
+
+
+@attr.s(auto_attribs=True, frozen=True, slots=True)
+class CachedResponse:
+    data: Any
+    stored_at: float
+
+    def age(self) -> float:
+        return max(time.time() - self.stored_at, 0.0)
+
+
+class ResponseCache:
+    """Responses of the API keyed by endpoints and service."""
+
+    # the services whose answer doesn't depend on the endpoint
+    services = ("cluster", "config")
+
+    def __init__(self, state_dir: str, max_age: float, name: str = "responses") -> None:
+        self.directory = os.path.join(state_dir, name)
+        self.max_age = max_age
+
+    def path(self, endpoints: List[str], service: str) -> str:
+        key = json.dumps([sorted(endpoints), service]).encode("utf-8")
+        digest = hashlib.sha1(key).hexdigest()
+        return os.path.join(self.directory, f"{service}-{digest}.json")
+
+    def load(self, endpoints: List[str], service: str) -> Optional[CachedResponse]:
+        """Get the last response stored, whatever its age."""
+        path = self.path(endpoints, service)
+        try:
+            with open(path, encoding="utf-8") as f:
+                content = json.load(f)
+            return CachedResponse(content["data"], float(content["stored_at"]))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            _log.debug(
+                "cannot read the cached response %(path)s: %(error)s",
+                {"path": path, "error": e},
+            )
+            return None
+
+    def get(self, endpoints: List[str], service: str) -> Optional[CachedResponse]:
+        """Get the last response stored if it's not older than max_age."""
+        cached = self.load(endpoints, service)
+        if cached is None or cached.age() > self.max_age:
+            return None
+        _log.debug(
+            "using the cached response to %(service)s (%(age).1fs old)",
+            {"service": service, "age": cached.age()},
+        )
+        return cached
+
+    def store(self, endpoints: List[str], service: str, data: Any) -> None:
+        path = self.path(endpoints, service)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".", suffix=".tmp")
+        except OSError as e:
+            _log.debug(
+                "cannot store the response in %(path)s: %(error)s",
+                {"path": path, "error": e},
+            )
+            return
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"stored_at": time.time(), "data": data}, f)
+            os.replace(tmp, path)
+        except OSError as e:
+            _log.debug(
+                "cannot store the response in %(path)s: %(error)s",
+                {"path": path, "error": e},
+            )
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+
+class SingleFlight:
+    """Coalesce the identical queries of concurrent checks.
+
+    The first check to take the lock of a query sends it and stores the
+    response in a shared slot. The checks which find the lock taken wait for
+    its release, up to a given time, and use the response stored meanwhile.
+    They send the query themselves if the first one failed or took too long.
+    """
+
+    # delay between two attempts to take the lock
+    poll_interval = 0.01
+
+    def __init__(self, state_dir: str, wait: float) -> None:
+        self.slots = ResponseCache(state_dir, 0, "flights")
+        self.wait = wait
+
+    def run(
+        self,
+        endpoints: List[str],
+        service: str,
+        fetch: Callable[[], Any],
+        wait: Optional[float] = None,
+    ) -> Any:
+        """Get the response to a query, fetch() is only called if no
+        concurrent check sent the query.
+        """
+        path = self.slots.path(endpoints, service)
+        lock_path = f"{os.path.splitext(path)[0]}.lock"
+        try:
+            os.makedirs(self.slots.directory, exist_ok=True)
+            fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        except OSError as e:
+            _log.debug(
+                "cannot open the lock file %(path)s: %(error)s",
+                {"path": lock_path, "error": e},
+            )
+            return fetch()
+
+        try:
+            since = time.time()
+            if not self._lock(fd, 0):
+                _log.debug(
+                    "%(service)s is being queried by another check, waiting for its response",
+                    {"service": service},
+                )
+                if self._lock(fd, self.wait if wait is None else wait):
+                    slot = self.slots.load(endpoints, service)
+                    if slot is not None and slot.stored_at >= since:
+                        return slot.data
+                _log.debug(
+                    "no response from the other check, querying %(service)s",
+                    {"service": service},
+                )
+            data = fetch()
+            self.slots.store(endpoints, service, data)
+            return data
+        finally:
+            # closing the file releases the lock
+            os.close(fd)
+
+    def _lock(self, fd: int, wait: float) -> bool:
+        """Take the lock, waiting up to `wait` seconds for its release."""
+        limit = time.monotonic() + wait
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                if time.monotonic() >= limit:
+                    return False
+            time.sleep(self.poll_interval)
@@ -0,0 +1,66 @@
+"""Thin client of the check_patroni daemon.
+
+The check is sent to the daemon through its Unix socket and its result is
+printed as the plugin would. Only the standard library is imported so that
+the client starts quickly.
+"""
+
+import argparse
+import json
+import socket
+import sys
+from typing import Any, Dict, List, Optional
+
+DEFAULT_SOCKET = "/run/check_patroni/daemon.sock"
+
+
+def request(
+    path: str, cluster: str, args: List[str], timeout: Optional[float] = None
+) -> Dict[str, Any]:
+    """Send a check to the daemon and get its result."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        with sock.makefile("rwb") as f:
+            f.write(json.dumps({"cluster": cluster, "args": args}).encode() + b"\n")
+            f.flush()
+            line = f.readline()
+    if not line:
+        raise ConnectionError("no answer from the daemon")
+    result: Dict[str, Any] = json.loads(line)
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="check_patroni_client",
+        description=(
+            "Check a service of a cluster of the fleet file of a check_patroni "
+            "daemon, which answers from the responses of the API it keeps."
+        ),
+    )
+    parser.add_argument(
+        "--socket",
+        default=DEFAULT_SOCKET,
+        help="Unix socket of the daemon (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=10,
+        help="Time in seconds to wait for the daemon (default: %(default)s).",
+    )
+    parser.add_argument("cluster", help="Name of the cluster in the fleet file.")
+    parser.add_argument(
+        "args", nargs=argparse.REMAINDER, help="The service and its options."
+    )
+    options = parser.parse_args(argv)
+    try:
+        result = request(options.socket, options.cluster, options.args, options.timeout)
+    except (OSError, ValueError) as e:
+        print(
+            f"UNKNOWN - cannot get the result from the daemon at {options.socket}: {e}"
+        )
+        sys.exit(3)
+    sys.stdout.write(result["output"])
+    sys.exit(result["exitcode"])
@@ -1,12 +1,18 @@
 import hashlib
 import json
 from collections import Counter
-from typing import Any, Iterable, Union
+from typing import Any, Iterable, List, Optional, Union
 
 import nagiosplugin
 
 from . import _log
-from .types import ConnectionInfo, PatroniResource, SyncType, handle_unknown
+from .types import (
+    ConnectionInfo,
+    Deadline,
+    PatroniResource,
+    SyncType,
+    handle_unknown,
+)
 
 
 def replace_chars(text: str) -> str:
@@ -14,6 +20,9 @@ def replace_chars(text: str) -> str:
 
 
 class ClusterNodeCount(PatroniResource):
+    def services(self) -> List[str]:
+        return ["cluster"] + self.detailed_states_services()
+
     def probe(self) -> Iterable[nagiosplugin.Metric]:
         def debug_member(member: Any, health: str) -> None:
             _log.debug(
@@ -80,6 +89,10 @@ class ClusterNodeCount(PatroniResource):
 
 
 class ClusterHasLeader(PatroniResource):
+    def services(self) -> List[str]:
+        # the version is only needed when there is a standby leader
+        return ["cluster"]
+
     def probe(self) -> Iterable[nagiosplugin.Metric]:
         item_dict = self.rest_api("cluster")
 
@@ -138,11 +151,15 @@ class ClusterHasReplica(PatroniResource):
         connection_info: ConnectionInfo,
         max_lag: Union[int, None],
         sync_type: SyncType,
+        deadline: Optional[Deadline] = None,
     ):
-        super().__init__(connection_info)
+        super().__init__(connection_info, deadline)
         self.max_lag = max_lag
         self.sync_type = sync_type
 
+    def services(self) -> List[str]:
+        return ["cluster"] + self.detailed_states_services()
+
     def probe(self) -> Iterable[nagiosplugin.Metric]:
         def debug_member(member: Any, health: str) -> None:
             _log.debug(
@@ -273,12 +290,16 @@ class ClusterConfigHasChanged(PatroniResource):
         config_hash: str,  # Always contains the old hash
         state_file: str,  # Only used to update the hash in the state_file (when needed)
         save: bool = False,  # Save the configuration
+        deadline: Optional[Deadline] = None,
     ):
-        super().__init__(connection_info)
+        super().__init__(connection_info, deadline)
         self.state_file = state_file
         self.config_hash = config_hash
         self.save = save
 
+    def services(self) -> List[str]:
+        return ["config"]
+
     def probe(self) -> Iterable[nagiosplugin.Metric]:
         item_dict = self.rest_api("config")
 
@@ -325,6 +346,9 @@ class ClusterConfigHasChangedSummary(nagiosplugin.Summary):
 
 
 class ClusterIsInMaintenance(PatroniResource):
+    def services(self) -> List[str]:
+        return ["cluster"]
+
     def probe(self) -> Iterable[nagiosplugin.Metric]:
         item_dict = self.rest_api("cluster")
 
@@ -338,6 +362,9 @@ class ClusterIsInMaintenance(PatroniResource):
 
 
 class ClusterHasScheduledAction(PatroniResource):
+    def services(self) -> List[str]:
+        return ["cluster"]
+
     def probe(self) -> Iterable[nagiosplugin.Metric]:
         item_dict = self.rest_api("cluster")
 
@@ -0,0 +1,66 @@
+"""Option defaults read from INI files.
+
+The options of a command are given in a section and those of its
+subcommands in subsections named after them, e.g. `[options]` and
+`[options.node_is_replica]`.
+"""
+
+import re
+from configparser import ConfigParser
+from typing import Any, Dict, Mapping
+
+
+def config_defaults(cfg: ConfigParser, root: str) -> Dict[str, Any]:
+    """Build a click default_map from the section `root` and its subsections.
+
+    >>> cfg = ConfigParser()
+    >>> cfg.read_string('''
+    ... [options]
+    ... endpoints = http://10.20.199.3:8008, http://10.20.199.4:8008
+    ... [options.node_is_replica]
+    ... lag = 100
+    ... [other]
+    ... timeout = 5
+    ... ''')
+    >>> config_defaults(cfg, "options")  # doctest: +NORMALIZE_WHITESPACE
+    {'endpoints': ['http://10.20.199.3:8008', 'http://10.20.199.4:8008'],
+     'node_is_replica': {'lag': '100'}}
+    """
+    root_path = root.split(".")
+    depth = len(root_path)
+    defaults_map: Dict[str, Any] = {}
+    for sect in cfg.sections():
+        command_path = sect.split(".")
+        if command_path[:depth] != root_path:
+            continue
+        defaults = defaults_map
+        for cmdname in command_path[depth:]:
+            defaults = defaults.setdefault(cmdname, {})
+        defaults.update(cfg[sect])
+        try:
+            # endpoints is an array of addresses separated by ,
+            if isinstance(defaults["endpoints"], str):
+                defaults["endpoints"] = re.split(r"\s*,\s*", defaults["endpoints"])
+        except KeyError:
+            pass
+    return defaults_map
+
+
+def merge_defaults(
+    base: Mapping[str, Any], override: Mapping[str, Any]
+) -> Dict[str, Any]:
+    """Merge two default_maps, the options of `override` win.
+
+    >>> merge_defaults(
+    ...     {"timeout": "2", "cluster_node_count": {"warning": "3:"}},
+    ...     {"timeout": "5", "cluster_node_count": {"critical": "2:"}},
+    ... )
+    {'timeout': '5', 'cluster_node_count': {'warning': '3:', 'critical': '2:'}}
+    """
+    merged = dict(base)
+    for key, value in override.items():
+        if isinstance(value, Mapping) and isinstance(merged.get(key), Mapping):
+            merged[key] = merge_defaults(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
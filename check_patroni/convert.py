@@ -12,6 +12,8 @@ def size_to_byte(value: str) -> int:
     5120
     >>> size_to_byte('.5kB')
     512
+    >>> size_to_byte('100')
+    100
     >>> size_to_byte('.5 yoyo')
     Traceback (most recent call last):
     ...
@@ -29,7 +31,7 @@ def size_to_byte(value: str) -> int:
     if val is None:
         val = 1
 
-    if unit is None:
+    if not unit:
         # No unit, all good
         # we can round half bytes dont really make sense
         return round(val)
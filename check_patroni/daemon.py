@@ -0,0 +1,237 @@
+"""Daemon answering the checks of a fleet from the responses it keeps.
+
+The cluster wide services of the API (/cluster, /config and /patroni) of
+each cluster of a fleet file are polled on a jittered schedule and their last
+responses are kept in memory. The checks received on a Unix socket are
+evaluated with these responses, so that the clients don't query the API.
+
+A response is stale when the next poll is overdue. A stale response is still
+used, the result tells its age and the cluster is polled again right away. A
+response older than the maximum staleness isn't used: the check queries the
+API itself.
+"""
+
+import io
+import json
+import logging
+import os
+import random
+import socketserver
+import stat
+import threading
+import time
+from typing import Any, Callable, Dict, List, Tuple, Type
+
+import attr
+import nagiosplugin
+from nagiosplugin.output import Output
+
+from . import _log
+from .evaluate import evaluate
+from .types import Deadline, Parameters, PatroniResource, shared_responses
+
+# build the checks of a service of a cluster given with its options
+Collect = Callable[[str, List[str]], Tuple[List[nagiosplugin.Check], Parameters]]
+
+
+@attr.s(auto_attribs=True, frozen=True, slots=True)
+class Response:
+    data: Any
+    fetched_at: float = attr.ib(factory=time.monotonic)
+
+    def age(self) -> float:
+        return time.monotonic() - self.fetched_at
+
+
+class ClusterPoller:
+    """Poll the cluster wide services of a cluster and keep their last
+    responses.
+    """
+
+    services = ("cluster", "config", "patroni")
+
+    def __init__(
+        self, name: str, parameters: Parameters, interval: float, jitter: float
+    ) -> None:
+        self.name = name
+        self.parameters = parameters
+        self.interval = interval
+        self.jitter = jitter
+        self.responses: Dict[str, Response] = {}
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+
+    @property
+    def endpoints(self) -> List[str]:
+        return self.parameters.connection_info.endpoints
+
+    @property
+    def stale_after(self) -> float:
+        """The age of a response when the next poll is overdue."""
+        return self.interval * (1 + self.jitter) + self.parameters.timeout
+
+    def poll(self) -> None:
+        """Fetch the services, the last response of a service is kept when
+        it can't be fetched.
+        """
+        resource = PatroniResource(
+            self.parameters.connection_info, Deadline(self.parameters.timeout)
+        )
+        for service in self.services:
+            try:
+                self.responses[service] = Response(resource.rest_api(service))
+            except Exception as e:
+                _log.debug(
+                    "cannot poll %(service)s of cluster %(cluster)s: %(error)s",
+                    {"service": service, "cluster": self.name, "error": e},
+                )
+
+    def delay(self) -> float:
+        """The time until the next poll, the jitter spreads the polls of the
+        clusters.
+        """
+        return self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def run(self) -> None:
+        while not self._stopped.is_set():
+            self.poll()
+            self._wakeup.wait(self.delay())
+            self._wakeup.clear()
+
+    def revalidate(self) -> None:
+        """Poll the cluster now."""
+        self._wakeup.set()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._wakeup.set()
+
+
+class Daemon:
+    """Evaluate the checks of the clusters with the responses kept by their
+    pollers.
+    """
+
+    def __init__(
+        self, pollers: Dict[str, ClusterPoller], collect: Collect, max_stale: float
+    ) -> None:
+        self.pollers = pollers
+        self.collect = collect
+        self.max_stale = max_stale
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        for poller in self.pollers.values():
+            thread = threading.Thread(target=poller.run, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self) -> None:
+        """Stop the pollers, waiting for the polls in progress."""
+        for poller in self.pollers.values():
+            poller.stop()
+        for thread in self._threads:
+            thread.join()
+        self._threads.clear()
+
+    def answer(self, request: Any) -> Dict[str, Any]:
+        """Evaluate the check of a request: the service of a cluster with its
+        options.
+        """
+        try:
+            cluster, args = request["cluster"], request["args"]
+        except (KeyError, TypeError):
+            return unknown(f"invalid request {request!r}")
+        if not isinstance(args, list) or not all(isinstance(a, str) for a in args):
+            return unknown(f"invalid request {request!r}")
+        poller = self.pollers.get(cluster)
+        if poller is None:
+            return unknown(f"unknown cluster {cluster!r}")
+        try:
+            checks, parameters = self.collect(cluster, args)
+        except Exception as e:
+            return unknown(str(e))
+
+        (check,) = checks
+        stale: Dict[str, float] = {}
+        with shared_responses() as snapshot:
+            for service, response in dict(poller.responses).items():
+                age = response.age()
+                if age > self.max_stale:
+                    continue
+                if age > poller.stale_after:
+                    stale[service] = round(age, 1)
+                snapshot.store(poller.endpoints, service, response.data)
+            if stale:
+                poller.revalidate()
+            evaluate(args[0], check)
+
+        output = Output(logging.StreamHandler(io.StringIO()), parameters.verbose)
+        output.add(check)
+        for service, age in stale.items():
+            output.add_longoutput(f"Stale response to {service}: {age}s old")
+        return {"exitcode": check.exitcode, "output": str(output), "stale": stale}
+
+
+def unknown(message: str) -> Dict[str, Any]:
+    return {"exitcode": 3, "output": f"UNKNOWN - {message}\n", "stale": {}}
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """Answer the requests of a client, one JSON object per line."""
+
+    server: "DaemonServer"
+
+    def handle(self) -> None:
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                result = unknown(f"invalid request: {e}")
+            else:
+                result = self.server.daemon.answer(request)
+            self.wfile.write(json.dumps(result).encode() + b"\n")
+            self.wfile.flush()
+
+
+class UnixServer(socketserver.ThreadingUnixStreamServer):
+    """A server listening on a Unix socket, the socket is removed when the
+    server is closed.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self, path: str, handler: Type[socketserver.BaseRequestHandler]
+    ) -> None:
+        # remove the socket left by a previous server
+        try:
+            if stat.S_ISSOCK(os.stat(path).st_mode):
+                os.unlink(path)
+        except FileNotFoundError:
+            pass
+        super().__init__(path, handler)
+
+    def server_close(self) -> None:
+        super().server_close()
+        try:
+            os.unlink(self.server_address)  # type: ignore[arg-type]
+        except OSError:
+            pass
+
+
+class DaemonServer(UnixServer):
+    def __init__(self, path: str, daemon: Daemon) -> None:
+        self.daemon = daemon
+        super().__init__(path, RequestHandler)
+
+
+def serve(path: str, daemon: Daemon) -> None:
+    """Poll the clusters and answer the requests received on the socket."""
+    daemon.start()
+    try:
+        with DaemonServer(path, daemon) as server:
+            _log.info("listening on %(path)s", {"path": path})
+            server.serve_forever()
+    finally:
+        daemon.stop()
@@ -0,0 +1,199 @@
+"""Evaluation of several checks by a single invocation of the plugin.
+
+The services are evaluated like nagiosplugin would, but their results are
+gathered instead of being printed one by one.
+"""
+
+import time
+import traceback
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import attr
+import nagiosplugin
+from nagiosplugin.state import ServiceState
+
+from . import _log
+
+
+@attr.s(auto_attribs=True, frozen=True, slots=True)
+class Evaluation:
+    service: str
+    name: str
+    state: ServiceState
+    summary: str
+    perfdata: List[str]
+    cluster: Optional[str] = None
+
+    @property
+    def status(self) -> str:
+        """The status line of the service, as nagiosplugin prints it."""
+        status = f"{self.name} {str(self.state).upper()}"
+        if self.summary:
+            status += f" - {self.summary}"
+        return status
+
+    @property
+    def output(self) -> str:
+        """The status line of the service with its perfdata."""
+        if self.perfdata:
+            return f"{self.status} | {' '.join(self.perfdata)}"
+        return self.status
+
+
+def evaluate(
+    service: str, check: nagiosplugin.Check, cluster: Optional[str] = None
+) -> Evaluation:
+    """Run a check, an unexpected error makes the service unknown."""
+    try:
+        check()
+    except nagiosplugin.Timeout:
+        raise
+    except Exception as e:
+        _log.debug(
+            "evaluation of %(service)s failed", {"service": service}, exc_info=True
+        )
+        hint = traceback.format_exception_only(type(e), e)[-1].strip()
+        check.results.add(nagiosplugin.Result(nagiosplugin.Unknown, hint))
+    return Evaluation(
+        service,
+        check.name.upper(),
+        check.state,
+        check.summary_str.strip(),
+        list(check.perfdata),
+        cluster,
+    )
+
+
+def threshold(context: nagiosplugin.Context, name: str) -> Optional[str]:
+    """Get a threshold of a context, if it has one.
+
+    >>> context = nagiosplugin.ScalarContext("members", "3:", None)
+    >>> threshold(context, "warning"), threshold(context, "critical")
+    ('3:', None)
+    >>> threshold(nagiosplugin.Context("leader"), "warning") is None
+    True
+    """
+    value = getattr(context, name, None)
+    if value is None or not str(value):
+        return None
+    return str(value)
+
+
+def report(service: str, check: nagiosplugin.Check, duration: float) -> Dict[str, Any]:
+    """Describe an evaluated check as a JSON object: its state, its summary
+    and each of its metrics with the thresholds of its context.
+    """
+    metrics = []
+    for result in check.results:
+        metric = result.metric
+        if metric is None:
+            continue
+        context = metric.contextobj
+        metrics.append(
+            {
+                "name": metric.name,
+                "value": metric.value,
+                "uom": metric.uom,
+                "min": metric.min,
+                "max": metric.max,
+                "context": metric.context,
+                "warning": threshold(context, "warning"),
+                "critical": threshold(context, "critical"),
+                "state": str(result.state),
+                "hint": result.hint,
+            }
+        )
+    return {
+        "service": service,
+        "name": check.name.upper(),
+        "state": str(check.state),
+        "exitcode": int(check.state),
+        "summary": check.summary_str.strip(),
+        "metrics": metrics,
+        "timing": {"duration": round(duration, 6)},
+    }
+
+
+def evaluate_report(
+    service: str, check: nagiosplugin.Check, timeout: int
+) -> Dict[str, Any]:
+    """Run a check within the timeout and describe it as a JSON object.
+
+    A timeout makes the service unknown, like nagiosplugin does, but the
+    metrics gathered until then are kept.
+    """
+    started_at = time.time()
+    start = time.monotonic()
+    try:
+        if timeout:
+            nagiosplugin.platform.with_timeout(timeout, evaluate, service, check)
+        else:
+            evaluate(service, check)
+    except nagiosplugin.Timeout:
+        check.results.add(
+            nagiosplugin.Result(
+                nagiosplugin.Unknown,
+                f"Timeout: check execution aborted after {timeout}s",
+            )
+        )
+    result = report(service, check, time.monotonic() - start)
+    result["timing"]["started_at"] = started_at
+    return result
+
+
+def perfdata_label(service: str, perfdata: str) -> str:
+    """Prefix the label of a performance data with the service, like
+    check_multi does.
+
+    >>> perfdata_label("cluster_node_count", "members=3")
+    'cluster_node_count::members=3'
+    >>> perfdata_label("cluster_node_count", "'state_in archive recovery'=1")
+    "'cluster_node_count::state_in archive recovery'=1"
+    """
+    if perfdata.startswith("'"):
+        return f"'{service}::{perfdata[1:]}"
+    return f"{service}::{perfdata}"
+
+
+def format_multi(name: str, evaluations: List[Evaluation]) -> Tuple[str, int]:
+    """Format the evaluations as a multi-line plugin output and get the exit
+    code.
+
+    The first line gives the worst state and the number of services in each
+    state, followed by the performance data of all the services. The status
+    line of each service follows.
+    """
+    status, state = summarize(name, evaluations)
+    perfdata = [perfdata_label(e.service, p) for e in evaluations for p in e.perfdata]
+    if perfdata:
+        status += " | " + " ".join(perfdata)
+    return "\n".join([status] + [e.status for e in evaluations]) + "\n", int(state)
+
+
+def format_fleet(name: str, evaluations: List[Evaluation]) -> Tuple[str, int]:
+    """Format the evaluations of several clusters and get the exit code.
+
+    The first line gives the worst state and the number of services in each
+    state. Each service of each cluster follows on its own line, with its
+    performance data.
+    """
+    status, state = summarize(name, evaluations)
+    lines = [status]
+    for e in evaluations:
+        lines.append(f"{e.cluster} {e.service}: {e.output}")
+    return "\n".join(lines) + "\n", int(state)
+
+
+def summarize(name: str, evaluations: List[Evaluation]) -> Tuple[str, ServiceState]:
+    """Get the status line giving the worst state of the evaluations and the
+    number of services in each state.
+    """
+    state = nagiosplugin.state.worst(e.state for e in evaluations)
+    counts = Counter(str(e.state) for e in evaluations)
+    summary = ", ".join(
+        f"{counts[s]} {s}"
+        for s in ("critical", "warning", "unknown", "ok")
+        if counts[s]
+    )
+    return f"{name} {str(state).upper()} - {summary}", state
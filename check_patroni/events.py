@@ -0,0 +1,203 @@
+"""Events of the topology of a cluster.
+
+The cluster service of the API is polled and an event is emitted each time
+the leader, the role, state or timeline of a member, the maintenance mode or
+a scheduled action changes. The cluster is polled quickly while it changes
+and less and less often while it's stable.
+"""
+
+import json
+import queue
+import socketserver
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from . import _log
+from .daemon import UnixServer
+from .types import ConnectionInfo, Deadline, PatroniResource
+
+Event = Dict[str, Any]
+
+# the attributes of the members whose changes are events
+MEMBER_ATTRIBUTES = ("role", "state", "timeline", "scheduled_restart")
+
+
+def topology(cluster: Dict[str, Any]) -> Dict[str, Any]:
+    """Get what the events are about from the response of the cluster service.
+
+    >>> topology({"members": [
+    ...     {"name": "p1", "role": "leader", "state": "running", "timeline": 3},
+    ...     {"name": "p2", "role": "replica", "state": "streaming", "timeline": 3},
+    ... ]})  # doctest: +NORMALIZE_WHITESPACE
+    {'leader': 'p1', 'pause': False, 'scheduled_switchover': None,
+     'members': {'p1': {'role': 'leader', 'state': 'running', 'timeline': 3,
+                        'scheduled_restart': None},
+                 'p2': {'role': 'replica', 'state': 'streaming', 'timeline': 3,
+                        'scheduled_restart': None}}}
+    """
+    members = {
+        member["name"]: {a: member.get(a) for a in MEMBER_ATTRIBUTES}
+        for member in cluster.get("members", [])
+    }
+    leaders = [
+        name
+        for name, member in members.items()
+        if member["role"] in ("leader", "standby_leader")
+    ]
+    return {
+        "leader": leaders[0] if leaders else None,
+        "pause": bool(cluster.get("pause", False)),
+        "scheduled_switchover": cluster.get("scheduled_switchover"),
+        "members": members,
+    }
+
+
+def changes(old: Dict[str, Any], new: Dict[str, Any]) -> List[Event]:
+    """Get the events between two topologies.
+
+    >>> old = topology({"members": [{"name": "p1", "role": "leader"}]})
+    >>> new = topology({"members": [{"name": "p2", "role": "leader"}], "pause": True})
+    >>> for event in changes(old, new):
+    ...     print(event)
+    {'event': 'leader_changed', 'old': 'p1', 'new': 'p2'}
+    {'event': 'pause_changed', 'old': False, 'new': True}
+    {'event': 'member_removed', 'member': 'p1'}
+    {'event': 'member_added', 'member': 'p2', 'role': 'leader', 'state': None, 'timeline': None, 'scheduled_restart': None}
+    """
+    events: List[Event] = []
+    for key in ("leader", "pause", "scheduled_switchover"):
+        if old[key] != new[key]:
+            events.append({"event": f"{key}_changed", "old": old[key], "new": new[key]})
+    for name, member in old["members"].items():
+        if name not in new["members"]:
+            events.append({"event": "member_removed", "member": name})
+            continue
+        for attribute in MEMBER_ATTRIBUTES:
+            if member[attribute] != new["members"][name][attribute]:
+                events.append(
+                    {
+                        "event": f"{attribute}_changed",
+                        "member": name,
+                        "old": member[attribute],
+                        "new": new["members"][name][attribute],
+                    }
+                )
+    for name, member in new["members"].items():
+        if name not in old["members"]:
+            events.append({"event": "member_added", "member": name, **member})
+    return events
+
+
+class ClusterWatcher:
+    """Poll the cluster service and emit the events of the cluster.
+
+    The interval between two polls starts at `min_interval`, it doubles after
+    each poll without event up to `max_interval` and goes back to
+    `min_interval` as soon as there is an event.
+    """
+
+    def __init__(
+        self,
+        conn_info: ConnectionInfo,
+        timeout: int,
+        min_interval: float,
+        max_interval: float,
+    ) -> None:
+        self.conn_info = conn_info
+        self.timeout = timeout
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.topology: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+
+    def poll(self) -> List[Event]:
+        """Poll the cluster service and get the events since the last poll.
+
+        The first poll gives the whole topology. The failures of the API are
+        events too: one when the API can't be reached anymore and one when
+        it's back.
+        """
+        resource = PatroniResource(self.conn_info, Deadline(self.timeout))
+        events: List[Event] = []
+        try:
+            current = topology(resource.rest_api("cluster"))
+        except Exception as e:
+            _log.debug("cannot poll the cluster: %(error)s", {"error": e})
+            if self.error is None:
+                events.append({"event": "api_unreachable", "error": str(e)})
+            self.error = str(e)
+        else:
+            if self.error is not None:
+                events.append({"event": "api_reachable"})
+                self.error = None
+            if self.topology is None:
+                events.append({"event": "topology", **current})
+            else:
+                events += changes(self.topology, current)
+            self.topology = current
+
+        if events:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * 2, self.max_interval)
+        now = time.time()
+        return [{"time": now, **event} for event in events]
+
+    def watch(self, emit: Callable[[Event], None], stop: threading.Event) -> None:
+        """Emit the events of the cluster until `stop` is set."""
+        while not stop.is_set():
+            for event in self.poll():
+                emit(event)
+            stop.wait(self.interval)
+
+
+class SubscriberHandler(socketserver.StreamRequestHandler):
+    """Send the events to a subscriber, one JSON object per line."""
+
+    server: "EventServer"
+
+    def handle(self) -> None:
+        events: "queue.Queue[Optional[bytes]]" = queue.Queue()
+        self.server.subscribe(events)
+        try:
+            while True:
+                line = events.get()
+                if line is None:
+                    return
+                self.wfile.write(line)
+                self.wfile.flush()
+        except OSError:
+            pass
+        finally:
+            self.server.unsubscribe(events)
+
+
+class EventServer(UnixServer):
+    """Publish the events to the subscribers connected to a Unix socket."""
+
+    def __init__(self, path: str) -> None:
+        self.subscribers: Set["queue.Queue[Optional[bytes]]"] = set()
+        self._lock = threading.Lock()
+        super().__init__(path, SubscriberHandler)
+
+    def subscribe(self, events: "queue.Queue[Optional[bytes]]") -> None:
+        with self._lock:
+            self.subscribers.add(events)
+
+    def unsubscribe(self, events: "queue.Queue[Optional[bytes]]") -> None:
+        with self._lock:
+            self.subscribers.discard(events)
+
+    def publish(self, event: Event) -> None:
+        line = json.dumps(event).encode() + b"\n"
+        with self._lock:
+            for events in self.subscribers:
+                events.put(line)
+
+    def server_close(self) -> None:
+        with self._lock:
+            for events in self.subscribers:
+                events.put(None)
+        super().server_close()
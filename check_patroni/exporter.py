@@ -0,0 +1,281 @@
+"""Metrics of the resources exposed to Prometheus.
+
+The resources of the cluster services and, for each member, those of the
+node services answered from the cluster service are probed together and
+their metrics are exposed as gauges in the text format of Prometheus. The
+metrics whose name holds a role or a state get it as a label, those of a
+member get its name as given by the API.
+
+The metrics are kept for a while so that the scrapers arriving meanwhile
+don't query the API again.
+"""
+
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import attr
+import nagiosplugin
+
+from . import _log
+from .cluster import (
+    ClusterHasLeader,
+    ClusterHasReplica,
+    ClusterHasScheduledAction,
+    ClusterIsInMaintenance,
+    ClusterNodeCount,
+)
+from .node import NodeIsPendingRestart, NodeIsPrimary, NodeIsReplica
+from .types import ConnectionInfo, Deadline, PatroniResource, prefetch, shared_responses
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+PREFIX = "patroni"
+
+# the metrics holding a label in their name, by context: the gauge, the label
+# and the pattern extracting its value from the name of the metric
+LABELED = {
+    "member_roles": ("members_by_role", "role", re.compile(r"role_(.*)")),
+    "member_statuses": ("members_by_state", "state", re.compile(r"state_(.*)")),
+}
+
+# the metrics of a member, by context: the gauge and the name of the metric
+# of a member
+MEMBER_METRICS = {
+    "replica_lag": ("replica_lag", "{}_lag"),
+    "replica_timeline": ("replica_timeline", "{}_timeline"),
+    "replica_sync": ("replica_sync", "{}_sync"),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+@attr.s(auto_attribs=True, frozen=True, slots=True)
+class Sample:
+    name: str
+    labels: Labels
+    value: float
+
+
+def metric_name(name: str) -> str:
+    """Get a valid Prometheus metric name.
+
+    >>> metric_name("state_in archive recovery")
+    'patroni_state_in_archive_recovery'
+    """
+    return f"{PREFIX}_" + re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def to_samples(
+    service: str,
+    metrics: Iterable[nagiosplugin.Metric],
+    labels: Labels = (),
+    members: Iterable[str] = (),
+) -> List[Sample]:
+    """Convert the metrics of a resource, those which aren't numbers are
+    left out.
+
+    The metrics of a member get its name, as given by the API in `members`,
+    as label. Those of an unknown member are left out.
+
+    >>> to_samples("cluster_has_replica", [
+    ...     nagiosplugin.Metric("healthy_replica", 2),
+    ...     nagiosplugin.Metric("srv_2_lag", 1024, context="replica_lag"),
+    ...     nagiosplugin.Metric("srv_3_lag", 0, context="replica_lag"),
+    ... ], members=["srv_1", "srv_2"])  # doctest: +NORMALIZE_WHITESPACE
+    [Sample(name='patroni_healthy_replica',
+            labels=(('service', 'cluster_has_replica'),), value=2.0),
+     Sample(name='patroni_replica_lag',
+            labels=(('service', 'cluster_has_replica'), ('member', 'srv_2')),
+            value=1024.0)]
+    """
+    samples = []
+    for metric in metrics:
+        if not isinstance(metric.value, (int, float)):
+            continue
+        name = metric.name
+        sample_labels = (("service", service),) + labels
+        if metric.context in MEMBER_METRICS:
+            name, template = MEMBER_METRICS[metric.context]
+            member = next(
+                (m for m in members if template.format(m) == metric.name), None
+            )
+            if member is None:
+                _log.debug(
+                    "no member for the metric %(metric)s", {"metric": metric.name}
+                )
+                continue
+            sample_labels += (("member", member),)
+        elif metric.context in LABELED:
+            name, label, pattern = LABELED[metric.context]
+            match = pattern.fullmatch(metric.name)
+            assert match is not None, metric.name
+            sample_labels += ((label, match.group(1)),)
+        samples.append(Sample(metric_name(name), sample_labels, float(metric.value)))
+    return samples
+
+
+def escape(value: str) -> str:
+    r"""Escape the value of a label.
+
+    >>> print(escape('a "b"\\c'))
+    a \"b\"\\c
+    """
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_samples(samples: Iterable[Sample]) -> str:
+    """Format the samples in the text format of Prometheus, grouped by
+    gauge.
+
+    >>> print(format_samples([
+    ...     Sample("patroni_up", (), 1.0),
+    ...     Sample("patroni_members", (("service", "cluster_node_count"),), 3.0),
+    ... ]), end="")
+    # TYPE patroni_up gauge
+    patroni_up 1
+    # TYPE patroni_members gauge
+    patroni_members{service="cluster_node_count"} 3
+    """
+    gauges: Dict[str, List[Sample]] = {}
+    for sample in samples:
+        gauges.setdefault(sample.name, []).append(sample)
+    lines = []
+    for name, gauge in gauges.items():
+        lines.append(f"# TYPE {name} gauge")
+        for sample in gauge:
+            labels = ",".join(f'{k}="{escape(v)}"' for k, v in sample.labels)
+            value = int(sample.value) if sample.value.is_integer() else sample.value
+            lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+    return "".join(f"{line}\n" for line in lines)
+
+
+class Exporter:
+    """Probe the resources of a cluster and keep their metrics for
+    `max_age` seconds.
+    """
+
+    def __init__(self, conn_info: ConnectionInfo, timeout: int, max_age: float) -> None:
+        self.conn_info = conn_info
+        self.timeout = timeout
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._metrics: Optional[Tuple[float, str]] = None
+
+    def resources(
+        self, members: List[str], deadline: Deadline
+    ) -> List[Tuple[str, PatroniResource]]:
+        """The resources probed, by service."""
+        conn_info = self.conn_info
+        resources: List[Tuple[str, PatroniResource]] = [
+            ("cluster_node_count", ClusterNodeCount(conn_info, deadline)),
+            ("cluster_has_leader", ClusterHasLeader(conn_info, deadline)),
+            (
+                "cluster_has_replica",
+                ClusterHasReplica(conn_info, None, "any", deadline),
+            ),
+            ("cluster_is_in_maintenance", ClusterIsInMaintenance(conn_info, deadline)),
+            (
+                "cluster_has_scheduled_action",
+                ClusterHasScheduledAction(conn_info, deadline),
+            ),
+        ]
+        for member in members:
+            resources += [
+                ("node_is_primary", NodeIsPrimary(conn_info, deadline, member)),
+                (
+                    "node_is_replica",
+                    NodeIsReplica(
+                        conn_info, None, False, False, "any", deadline, member
+                    ),
+                ),
+                (
+                    "node_is_pending_restart",
+                    NodeIsPendingRestart(conn_info, deadline, member),
+                ),
+            ]
+        return resources
+
+    def collect(self) -> List[Sample]:
+        """Probe the resources, sharing the responses of the API."""
+        start = time.monotonic()
+        deadline = Deadline(self.timeout)
+        samples = []
+        with shared_responses():
+            try:
+                cluster = PatroniResource(self.conn_info, deadline).rest_api("cluster")
+                members = [m["name"] for m in cluster.get("members", [])]
+            except Exception as e:
+                _log.debug("cannot get the members: %(error)s", {"error": e})
+                members = []
+            resources = self.resources(members, deadline)
+            prefetch(r for _, r in resources)
+            for service, resource in resources:
+                labels: Labels = ()
+                member = getattr(resource, "member", None)
+                if member is not None:
+                    labels = (("member", member),)
+                try:
+                    metrics = list(resource.probe())
+                except Exception as e:
+                    _log.debug(
+                        "cannot probe %(service)s: %(error)s",
+                        {"service": service, "error": e},
+                    )
+                    success = 0.0
+                else:
+                    samples += to_samples(service, metrics, labels, members)
+                    success = 1.0
+                samples.append(
+                    Sample(
+                        metric_name("probe_success"),
+                        (("service", service),) + labels,
+                        success,
+                    )
+                )
+        samples += [
+            Sample(
+                metric_name("scrape_duration_seconds"), (), time.monotonic() - start
+            ),
+            Sample(metric_name("scrape_timestamp_seconds"), (), time.time()),
+        ]
+        return samples
+
+    def metrics(self) -> str:
+        """Get the metrics, probed again when they are older than max_age.
+
+        The scrapers arriving while the resources are probed wait for the
+        result.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._metrics is None or now - self._metrics[0] > self.max_age:
+                self._metrics = now, format_samples(self.collect())
+            return self._metrics[1]
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    server: "ExporterServer"
+
+    def do_GET(self) -> None:
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.exporter.metrics().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: object) -> None:
+        _log.debug(format, *args)
+
+
+class ExporterServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], exporter: Exporter) -> None:
+        self.exporter = exporter
+        super().__init__(address, MetricsHandler)
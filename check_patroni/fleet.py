@@ -0,0 +1,165 @@
+"""Checks of several clusters by a single invocation of the plugin.
+
+The clusters are listed in a fleet file using the sections of the config
+file:
+
+* `[options]` and `[options.<service>]` give the defaults of all the
+  clusters, each `[options.<service>]` section adds a service checked on all
+  of them;
+* `[cluster.<name>]` gives the options of a cluster (endpoints, TLS files,
+  timeout...) and `[cluster.<name>.<service>]` the options of a service
+  checked on this cluster.
+
+The clusters are checked concurrently, each one within its own timeout so
+that a cluster which doesn't answer doesn't hold the others up.
+"""
+
+import queue
+import threading
+import time
+import traceback
+from configparser import ConfigParser
+from typing import Any, Dict, List, Optional, Tuple
+
+import attr
+import nagiosplugin
+
+from . import _log
+from .config import config_defaults, merge_defaults
+from .evaluate import Evaluation, evaluate
+from .types import Deadline, PatroniResource, prefetch, shared_responses
+
+
+def read_fleet(filename: str) -> Dict[str, Dict[str, Any]]:
+    """Get the default_map of each cluster of a fleet file, by name."""
+    cfg = ConfigParser()
+    cfg.read(filename)
+    options = config_defaults(cfg, "options")
+    clusters: Dict[str, Dict[str, Any]] = {}
+    for sect in cfg.sections():
+        path = sect.split(".")
+        if path[0] != "cluster" or len(path) < 2 or path[1] in clusters:
+            continue
+        clusters[path[1]] = merge_defaults(
+            options, config_defaults(cfg, f"cluster.{path[1]}")
+        )
+    return clusters
+
+
+def fleet_services(defaults: Dict[str, Any]) -> List[str]:
+    """Get the services checked on a cluster: those with a section.
+
+    >>> fleet_services({"timeout": "5", "cluster_has_leader": {}})
+    ['cluster_has_leader']
+    """
+    return [name for name, value in defaults.items() if isinstance(value, dict)]
+
+
+@attr.s(auto_attribs=True, frozen=True, slots=True)
+class ClusterChecks:
+    """The checks of the services of a cluster."""
+
+    name: str
+    timeout: int
+    checks: List[Tuple[str, nagiosplugin.Check]]
+
+    def run(self) -> List[Evaluation]:
+        """Evaluate the services, sharing the responses of the API."""
+        # the time budget starts when the cluster is checked, not when the
+        # checks were built
+        deadline = Deadline(self.timeout)
+        resources = [r for _, check in self.checks for r in check.resources]
+        for resource in resources:
+            if isinstance(resource, PatroniResource):
+                resource.deadline = deadline
+        with shared_responses():
+            prefetch(resources)
+            return [
+                evaluate(service, check, self.name) for service, check in self.checks
+            ]
+
+    def timed_out(self) -> List[Evaluation]:
+        """The evaluations of a cluster whose check didn't end in time."""
+        return self.failed(f"Timeout: check execution aborted after {self.timeout}s")
+
+    def failed(self, hint: str) -> List[Evaluation]:
+        """The evaluations of a cluster whose check couldn't be completed."""
+        return [
+            Evaluation(
+                service, check.name.upper(), nagiosplugin.Unknown, hint, [], self.name
+            )
+            for service, check in self.checks
+        ]
+
+
+def run_fleet(clusters: List[ClusterChecks], concurrency: int) -> List[Evaluation]:
+    """Check the clusters, `concurrency` of them at a time, and get their
+    evaluations in order.
+
+    The clusters are checked by daemon threads. A cluster whose check doesn't
+    end within its timeout or fails is unknown and the plugin goes on with
+    the others.
+    """
+    pending: "queue.Queue[int]" = queue.Queue()
+    for i in range(len(clusters)):
+        pending.put(i)
+    started: List[Optional[float]] = [None] * len(clusters)
+    running = [threading.Event() for _ in clusters]
+    results: List[Optional[List[Evaluation]]] = [None] * len(clusters)
+    done = [threading.Event() for _ in clusters]
+
+    def work() -> None:
+        while True:
+            try:
+                i = pending.get_nowait()
+            except queue.Empty:
+                return
+            started[i] = time.monotonic()
+            running[i].set()
+            try:
+                results[i] = clusters[i].run()
+            except Exception as e:
+                _log.debug(
+                    "check of cluster %(cluster)s failed",
+                    {"cluster": clusters[i].name},
+                    exc_info=True,
+                )
+                hint = traceback.format_exception_only(type(e), e)[-1].strip()
+                results[i] = clusters[i].failed(hint)
+            finally:
+                done[i].set()
+
+    workers = [
+        threading.Thread(target=work, daemon=True)
+        for _ in range(min(concurrency, len(clusters)))
+    ]
+    for worker in workers:
+        worker.start()
+
+    evaluations: List[Evaluation] = []
+    for i, cluster in enumerate(clusters):
+        # don't wait for a cluster that no worker is left to check
+        while not running[i].wait(0.1):
+            if not any(worker.is_alive() for worker in workers):
+                break
+        if not running[i].is_set():
+            evaluations += cluster.failed("the check of the cluster was not started")
+            continue
+        wait = None
+        if cluster.timeout:
+            start = started[i]
+            assert start is not None
+            wait = max(cluster.timeout - (time.monotonic() - start), 0.0)
+        done[i].wait(wait)
+        result = results[i]
+        if result is None and done[i].is_set():
+            # the worker was interrupted
+            result = cluster.failed("the check of the cluster was interrupted")
+        elif result is None:
+            _log.debug(
+                "check of cluster %(cluster)s aborted after %(timeout)ss",
+                {"cluster": cluster.name, "timeout": cluster.timeout},
+            )
+            result = cluster.timed_out()
+        evaluations += result
+    return evaluations
@@ -1,13 +1,68 @@
-from typing import Iterable
+from typing import Any, Dict, Iterable, List, Optional
 
 import nagiosplugin
 
 from . import _log
-from .types import APIError, ConnectionInfo, PatroniResource, SyncType, handle_unknown
+from .convert import size_to_byte
+from .types import (
+    APIError,
+    ConnectionInfo,
+    Deadline,
+    PatroniResource,
+    SyncType,
+    handle_unknown,
+)
+
+
+class MemberResource(PatroniResource):
+    """A node service which can also be answered from the description of the
+    member in /cluster, fetched from any endpoint (see --member).
+    """
 
+    def __init__(
+        self,
+        connection_info: ConnectionInfo,
+        deadline: Optional[Deadline] = None,
+        member: Optional[str] = None,
+    ) -> None:
+        super().__init__(connection_info, deadline)
+        self.member = member
+
+    def services(self) -> List[str]:
+        if self.member is not None:
+            return ["cluster"]
+        return self.node_services()
+
+    def node_services(self) -> List[str]:
+        """The services needed without --member."""
+        return []
+
+    def cluster_member(self) -> Dict[str, Any]:
+        item_dict = self.rest_api("cluster")
+        for member in item_dict["members"]:
+            if member["name"] == self.member:
+                _log.debug(
+                    "Member %(name)s: role %(role)s state %(state)s.",
+                    {
+                        "name": member["name"],
+                        "role": member["role"],
+                        "state": member["state"],
+                    },
+                )
+                return member  # type: ignore[no-any-return]
+        raise nagiosplugin.CheckError(f"Member {self.member} not found in the cluster")
+
+
+class NodeIsPrimary(MemberResource):
+    def node_services(self) -> List[str]:
+        return ["primary"]
 
-class NodeIsPrimary(PatroniResource):
     def probe(self) -> Iterable[nagiosplugin.Metric]:
+        if self.member is not None:
+            member = self.cluster_member()
+            is_primary = member["role"] == "leader" and member["state"] == "running"
+            return [nagiosplugin.Metric("is_primary", 1 if is_primary else 0)]
+
         try:
             self.rest_api("primary")
         except APIError:
@@ -26,15 +81,24 @@ class NodeIsPrimarySummary(nagiosplugin.Summary):
 
 class NodeIsLeader(PatroniResource):
     def __init__(
-        self, connection_info: ConnectionInfo, check_is_standby_leader: bool
+        self,
+        connection_info: ConnectionInfo,
+        check_is_standby_leader: bool,
+        deadline: Optional[Deadline] = None,
     ) -> None:
-        super().__init__(connection_info)
+        super().__init__(connection_info, deadline)
         self.check_is_standby_leader = check_is_standby_leader
 
-    def probe(self) -> Iterable[nagiosplugin.Metric]:
-        apiname = "leader"
+    def services(self) -> List[str]:
+        return [self.apiname()]
+
+    def apiname(self) -> str:
         if self.check_is_standby_leader:
-            apiname = "standby-leader"
+            return "standby-leader"
+        return "leader"
+
+    def probe(self) -> Iterable[nagiosplugin.Metric]:
+        apiname = self.apiname()
 
         try:
             self.rest_api(apiname)
@@ -58,28 +122,38 @@ class NodeIsLeaderSummary(nagiosplugin.Summary):
         return f"This node is not a {self.leader_kind} node."
 
 
-class NodeIsReplica(PatroniResource):
+class NodeIsReplica(MemberResource):
     def __init__(
         self,
         connection_info: ConnectionInfo,
-        max_lag: str,
+        max_lag: Optional[str],
         check_is_sync: bool,
         check_is_async: bool,
         sync_type: SyncType,
+        deadline: Optional[Deadline] = None,
+        member: Optional[str] = None,
     ) -> None:
-        super().__init__(connection_info)
+        super().__init__(connection_info, deadline, member)
         self.max_lag = max_lag
         self.check_is_sync = check_is_sync
         self.check_is_async = check_is_async
         self.sync_type = sync_type
 
+    def node_services(self) -> List[str]:
+        if self.max_lag is None:
+            return ["replica"]
+        return [f"replica?lag={self.max_lag}"]
+
     def probe(self) -> Iterable[nagiosplugin.Metric]:
+        if self.member is not None:
+            return [
+                nagiosplugin.Metric("is_replica", 1 if self.member_is_replica() else 0)
+            ]
+
         item_dict = {}
         try:
-            if self.max_lag is None:
-                item_dict = self.rest_api("replica")
-            else:
-                item_dict = self.rest_api(f"replica?lag={self.max_lag}")
+            (service,) = self.node_services()
+            item_dict = self.rest_api(service)
         except APIError:
             return [nagiosplugin.Metric("is_replica", 0)]
 
@@ -98,6 +172,34 @@ class NodeIsReplica(PatroniResource):
         else:
             return [nagiosplugin.Metric("is_replica", 1)]
 
+    def member_is_replica(self) -> bool:
+        """Apply the rules of Patroni's replica endpoints to the description of
+        the member in /cluster.
+        """
+        member = self.cluster_member()
+        role: str = member["role"]
+        if role not in ["replica", "sync_standby", "quorum_standby"] or member[
+            "state"
+        ] not in ["running", "streaming", "in archive recovery"]:
+            return False
+
+        if member.get("tags", {}).get("noloadbalance"):
+            return False
+
+        if self.max_lag is not None:
+            lag = member.get("lag")
+            # the lag is "unknown" when the replica is not replicating
+            if not isinstance(lag, int) or lag > size_to_byte(self.max_lag):
+                return False
+
+        if self.check_is_sync:
+            return (self.sync_type in ["sync", "any"] and role == "sync_standby") or (
+                self.sync_type in ["quorum", "any"] and role == "quorum_standby"
+            )
+        if self.check_is_async:
+            return role == "replica"
+        return True
+
 
 class NodeIsReplicaSummary(nagiosplugin.Summary):
     def __init__(
@@ -129,9 +231,15 @@ class NodeIsReplicaSummary(nagiosplugin.Summary):
         return f"This node is not a running {self.replica_kind} with no noloadbalance tag and a lag under {self.lag}."
 
 
-class NodeIsPendingRestart(PatroniResource):
+class NodeIsPendingRestart(MemberResource):
+    def node_services(self) -> List[str]:
+        return ["patroni"]
+
     def probe(self) -> Iterable[nagiosplugin.Metric]:
-        item_dict = self.rest_api("patroni")
+        if self.member is not None:
+            item_dict = self.cluster_member()
+        else:
+            item_dict = self.rest_api("patroni")
 
         is_pending_restart = item_dict.get("pending_restart", False)
         return [
@@ -151,21 +259,33 @@ class NodeIsPendingRestartSummary(nagiosplugin.Summary):
         return "This node has the pending restart flag."
 
 
-class NodeTLHasChanged(PatroniResource):
+class NodeTLHasChanged(MemberResource):
     def __init__(
         self,
         connection_info: ConnectionInfo,
         timeline: str,  # Always contains the old timeline
         state_file: str,  # Only used to update the timeline in the state_file (when needed)
         save: bool,  # save timeline in state file
+        deadline: Optional[Deadline] = None,
+        member: Optional[str] = None,
     ) -> None:
-        super().__init__(connection_info)
+        super().__init__(connection_info, deadline, member)
         self.state_file = state_file
         self.timeline = timeline
         self.save = save
 
+    def node_services(self) -> List[str]:
+        return ["patroni"]
+
     def probe(self) -> Iterable[nagiosplugin.Metric]:
-        item_dict = self.rest_api("patroni")
+        if self.member is not None:
+            item_dict = self.cluster_member()
+            if "timeline" not in item_dict:
+                raise nagiosplugin.CheckError(
+                    f"The timeline of member {self.member} is unknown"
+                )
+        else:
+            item_dict = self.rest_api("patroni")
         new_tl = item_dict["timeline"]
 
         _log.debug("save result: %(issave)s", {"issave": self.save})
@@ -209,10 +329,18 @@ class NodeTLHasChangedSummary(nagiosplugin.Summary):
 
 
 class NodePatroniVersion(PatroniResource):
-    def __init__(self, connection_info: ConnectionInfo, patroni_version: str) -> None:
-        super().__init__(connection_info)
+    def __init__(
+        self,
+        connection_info: ConnectionInfo,
+        patroni_version: str,
+        deadline: Optional[Deadline] = None,
+    ) -> None:
+        super().__init__(connection_info, deadline)
         self.patroni_version = patroni_version
 
+    def services(self) -> List[str]:
+        return ["patroni"]
+
     def probe(self) -> Iterable[nagiosplugin.Metric]:
         item_dict = self.rest_api("patroni")
 
@@ -246,6 +374,9 @@ class NodePatroniVersionSummary(nagiosplugin.Summary):
 
 
 class NodeIsAlive(PatroniResource):
+    def services(self) -> List[str]:
+        return ["liveness"]
+
     def probe(self) -> Iterable[nagiosplugin.Metric]:
         try:
             self.rest_api("liveness")
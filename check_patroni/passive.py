@@ -0,0 +1,279 @@
+"""Passive submission of the results of the services to Nagios or Icinga.
+
+Instead of letting the monitoring system run one active check per service
+and cluster, a single invocation evaluates them all and submits the results
+as passive check results, the cluster being the host and the service the
+service description. The results are written to:
+
+* `checkresults:<directory>`: the check result spool directory of Nagios (or
+  the `CheckResultReader` of Icinga 2), one file per batch;
+* `command_file:<path>`: the external command file (a named pipe), one
+  `PROCESS_SERVICE_CHECK_RESULT` command per result;
+* `icinga2:<url>`: the API of Icinga 2, one `process-check-result` action
+  per result over a single connection, the credentials being given in the url.
+  When a batch fails, only the results which were not accepted yet are sent
+  again.
+"""
+
+import base64
+import http.client
+import json
+import os
+import secrets
+import select
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+from . import _log
+from .evaluate import Evaluation
+from .transport import Cert, ssl_context
+
+SINKS = ("checkresults", "command_file", "icinga2")
+
+
+class SubmissionError(IOError):
+    """This exception is raised when the results could not be submitted."""
+
+
+def escape_output(output: str) -> str:
+    r"""Escape the output of a service so that it holds on one line, the way
+    Nagios unescapes it.
+
+    >>> print(escape_output("CLUSTERHASLEADER OK\nC:\\path"))
+    CLUSTERHASLEADER OK\nC:\\path
+    """
+    return output.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+class Sink(ABC):
+    """Submit batches of results to the monitoring system."""
+
+    @abstractmethod
+    def submit(self, evaluations: List[Evaluation]) -> None:
+        """Submit a batch of results, an OSError tells it failed.
+
+        The sinks which submit the results one at a time remove those which
+        were accepted from the batch, so that only the others are submitted
+        again.
+        """
+
+
+class CheckResultsSpool(Sink):
+    """Write the results in the check result spool directory.
+
+    Each batch is written in a file whose name is `c` followed by six
+    characters, as Nagios expects, and an empty `.ok` file tells that it's
+    complete.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+
+    def create(self) -> Tuple[str, int]:
+        """Create a new file in the directory and get its path and descriptor."""
+        while True:
+            path = os.path.join(self.directory, f"c{secrets.token_hex(3)}")
+            try:
+                return path, os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            except FileExistsError:
+                continue
+
+    def submit(self, evaluations: List[Evaluation]) -> None:
+        now = time.time()
+        lines = ["### Passive Check Result File ###", f"file_time={int(now)}", ""]
+        for e in evaluations:
+            lines += [
+                "### Nagios Service Check Result ###",
+                f"# Time: {time.ctime(now)}",
+                f"host_name={e.cluster}",
+                f"service_description={e.service}",
+                "check_type=1",
+                "check_options=0",
+                "scheduled_check=0",
+                "reschedule_check=0",
+                "latency=0.0",
+                f"start_time={now:.6f}",
+                f"finish_time={now:.6f}",
+                "early_timeout=0",
+                "exited_ok=1",
+                f"return_code={int(e.state)}",
+                f"output={escape_output(e.output)}",
+                "",
+            ]
+        path, fd = self.create()
+        with os.fdopen(fd, "w") as f:
+            f.write("\n".join(lines))
+        # the file is processed only once the .ok file exists
+        with open(f"{path}.ok", "w"):
+            pass
+
+
+class CommandFile(Sink):
+    """Write the results as external commands in the command file.
+
+    The commands are written in chunks of whole lines no larger than PIPE_BUF
+    so that they aren't mixed with those of the other writers of the pipe.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def submit(self, evaluations: List[Evaluation]) -> None:
+        now = int(time.time())
+        commands = [
+            f"[{now}] PROCESS_SERVICE_CHECK_RESULT;{e.cluster};{e.service};"
+            f"{int(e.state)};{escape_output(e.output)}\n".encode()
+            for e in evaluations
+        ]
+        chunks: List[bytes] = []
+        for command in commands:
+            if chunks and len(chunks[-1]) + len(command) <= select.PIPE_BUF:
+                chunks[-1] += command
+            else:
+                chunks.append(command)
+        # without reader, opening the pipe fails instead of blocking
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_NONBLOCK)
+        try:
+            os.set_blocking(fd, True)
+            for chunk in chunks:
+                os.write(fd, chunk)
+        finally:
+            os.close(fd)
+
+
+class Icinga2API(Sink):
+    """Send the results to the API of Icinga 2, as `process-check-result`
+    actions on the service of the host named after the cluster.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        cert: Cert = None,
+        verify: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> None:
+        parsed = urlparse(url)
+        if parsed.scheme not in ("http", "https") or not parsed.hostname:
+            raise ValueError(f"invalid url {url!r}")
+        self.scheme = parsed.scheme
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.path = parsed.path.rstrip("/") + "/v1/actions/process-check-result"
+        self.headers = {
+            "Accept": "application/json",
+            "Content-Type": "application/json",
+        }
+        if parsed.username is not None:
+            credentials = f"{unquote(parsed.username)}:{unquote(parsed.password or '')}"
+            self.headers["Authorization"] = (
+                "Basic " + base64.b64encode(credentials.encode()).decode()
+            )
+        self.cert = cert
+        self.verify = verify
+        self.timeout = timeout
+
+    def connect(self) -> http.client.HTTPConnection:
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(
+                self.host,
+                self.port,
+                timeout=self.timeout,
+                context=ssl_context(self.cert, self.verify),
+            )
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def submit(self, evaluations: List[Evaluation]) -> None:
+        conn = self.connect()
+        try:
+            while evaluations:
+                e = evaluations[0]
+                body: Dict[str, object] = {
+                    "type": "Service",
+                    "filter": "host.name==host && service.name==service",
+                    "filter_vars": {"host": e.cluster, "service": e.service},
+                    "exit_status": int(e.state),
+                    "plugin_output": e.status,
+                    "performance_data": e.perfdata,
+                    "check_source": "check_patroni",
+                }
+                conn.request("POST", self.path, json.dumps(body), self.headers)
+                r = conn.getresponse()
+                text = r.read().decode(errors="replace")
+                if r.status != 200:
+                    raise SubmissionError(
+                        f"the result of {e.service} for {e.cluster} was rejected "
+                        f"with status code {r.status}: {text}"
+                    )
+                del evaluations[0]
+        finally:
+            conn.close()
+
+
+def make_sink(
+    spec: str,
+    cert: Cert = None,
+    verify: Optional[str] = None,
+    timeout: Optional[float] = None,
+) -> Sink:
+    """Get the sink given as `<kind>:<target>`, `timeout` bounds the network
+    operations of the icinga2 sink.
+
+    >>> make_sink("checkresults:/var/spool/nagios/checkresults").directory
+    '/var/spool/nagios/checkresults'
+    >>> make_sink("nsca:localhost")
+    Traceback (most recent call last):
+      ...
+    ValueError: unknown sink 'nsca', expected one of checkresults, command_file, icinga2
+    """
+    kind, sep, target = spec.partition(":")
+    if not sep or not target:
+        raise ValueError(f"expected <kind>:<target>, got {spec!r}")
+    if kind == "checkresults":
+        return CheckResultsSpool(target)
+    if kind == "command_file":
+        return CommandFile(target)
+    if kind == "icinga2":
+        return Icinga2API(target, cert, verify, timeout)
+    raise ValueError(f"unknown sink {kind!r}, expected one of {', '.join(SINKS)}")
+
+
+def submit(
+    sink: Sink,
+    evaluations: List[Evaluation],
+    batch_size: int = 0,
+    retries: int = 0,
+    retry_delay: float = 1.0,
+) -> None:
+    """Submit the results in batches of `batch_size` (0 for a single batch).
+
+    A batch which fails is submitted again, less the results the sink already
+    accepted, up to `retries` times, `retry_delay` seconds apart.
+    """
+    batches: List[List[Evaluation]] = []
+    for e in evaluations:
+        if not batches or len(batches[-1]) == batch_size:
+            batches.append([])
+        batches[-1].append(e)
+    for batch in batches:
+        for attempt in range(retries + 1):
+            try:
+                sink.submit(batch)
+            except (OSError, http.client.HTTPException) as e:
+                _log.debug(
+                    "submission of %(count)s results failed: %(error)s",
+                    {"count": len(batch), "error": e},
+                )
+                if attempt == retries:
+                    raise SubmissionError(
+                        f"cannot submit the results after {retries + 1} attempts: {e}"
+                    ) from e
+                time.sleep(retry_delay)
+            else:
+                break
+    _log.info(
+        "%(count)s results submitted in %(batches)s batches",
+        {"count": len(evaluations), "batches": len(batches)},
+    )
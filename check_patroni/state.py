@@ -0,0 +1,375 @@
+"""State shared by the invocations of the plugin.
+
+The state is stored in the directory given with `--state-dir` using
+nagiosplugin's cookies, which are locked so that concurrent checks can share
+them. The state is only used to query the API more efficiently: any error
+while reading or writing it is logged and ignored.
+"""
+
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import nagiosplugin
+
+from . import _log
+
+
+@contextmanager
+def open_cookie(
+    path: str, commit: bool = True
+) -> Iterator[Optional[nagiosplugin.Cookie]]:
+    """Open and commit a cookie, yield None if it can't be used."""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        cookie = nagiosplugin.Cookie(path)
+        cookie.open()
+    except (OSError, ValueError) as e:
+        _log.debug(
+            "cannot open the state file %(path)s: %(error)s",
+            {"path": path, "error": e},
+        )
+        yield None
+        return
+    try:
+        yield cookie
+        if commit:
+            cookie.commit()
+    finally:
+        cookie.close()
+
+
+class EndpointsState:
+    """Outcome of the last queries sent to each endpoint.
+
+    The endpoints are tried in order of recent success then latency, so that
+    a node which is down doesn't cost an attempt to every check.
+
+    The latencies of the last successful queries are kept to derive the
+    timeout of each endpoint from its own latency. The outcomes older than
+    `max_age` seconds are ignored, the endpoint is unknown again.
+
+    The outcomes are recorded in memory and stored together by commit(), so
+    that a check writes the state file once whatever the number of queries
+    it sends.
+
+    When `breaker_threshold` is set, an endpoint which failed that many times
+    in a row is skipped for `breaker_cooldown` seconds (the breaker is open).
+    Once the cool-down is over, a single check is allowed to try it first (the
+    breaker is half-open): the breaker is closed if it succeeds and opened
+    again otherwise. While the breakers of all the endpoints are open, the
+    checks fail without querying any of them.
+    """
+
+    # number of latencies kept for each endpoint
+    max_samples = 20
+    # number of latencies required to trust the percentiles
+    min_samples = 5
+    # age in seconds of the outcomes after which they are ignored
+    max_age = 600.0
+
+    def __init__(
+        self,
+        state_dir: str,
+        breaker_threshold: int = 0,
+        breaker_cooldown: float = 30.0,
+    ) -> None:
+        self.path = os.path.join(state_dir, "endpoints.state")
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.stats: Dict[str, Any] = {}
+        # outcomes recorded since the last commit: endpoint, ok, latency, time
+        self.outcomes: List[Tuple[str, bool, float, float]] = []
+        self.lock = threading.Lock()
+
+    def plan(self, endpoints: List[str]) -> List[str]:
+        """Get the endpoints to try, in order.
+
+        The endpoints on trial (whose breaker is half-open) come first, so
+        that the trial takes place even if another endpoint answers. Then
+        those which answered last, the fastest first, then the unknown ones
+        and last those which failed. The configuration order is kept between
+        equivalent endpoints. The endpoints whose breaker is open are left
+        out, a CheckError is raised if they all are.
+        """
+        now = time.time()
+        stats: Dict[str, Any] = {}
+        with open_cookie(self.path, commit=False) as cookie:
+            if cookie is not None:
+                stats = {
+                    endpoint: stat
+                    for endpoint, stat in cookie.data.items()
+                    if not self._expired(stat, now)
+                }
+            admitted = []
+            trials = set()
+            for endpoint in endpoints:
+                breaker = self._breaker(endpoint, stats.get(endpoint), now)
+                if breaker == "open":
+                    continue
+                if breaker == "half-open":
+                    # the other checks will skip the endpoint during the trial
+                    stats[endpoint]["open_until"] = now + self.breaker_cooldown
+                    trials.add(endpoint)
+                admitted.append(endpoint)
+            if cookie is not None and trials:
+                cookie.commit()
+
+        if endpoints and not admitted:
+            retry = min(stats[endpoint]["open_until"] for endpoint in endpoints)
+            raise nagiosplugin.CheckError(
+                f"circuit open for all endpoints, retry in {math.ceil(retry - now)}s"
+            )
+
+        # the outcomes of the check which are not stored yet are known too
+        with self.lock:
+            for outcome in self.outcomes:
+                self._update(stats, *outcome)
+        self.stats = stats
+
+        def key(endpoint: str) -> Any:
+            if endpoint in trials:
+                return (-1, 0.0)
+            stat = stats.get(endpoint)
+            if stat is None:
+                return (1, 0.0)
+            if not stat["ok"]:
+                return (2, 0.0)
+            return (0, stat["latency"])
+
+        ordered = sorted(admitted, key=key)
+        if ordered != endpoints:
+            _log.debug(
+                "endpoints ordered by last outcome: %(endpoints)s",
+                {"endpoints": ordered},
+            )
+        return ordered
+
+    def _breaker(
+        self, endpoint: str, stat: Optional[Dict[str, Any]], now: float
+    ) -> str:
+        """Get the state of the breaker of an endpoint: closed, open or
+        half-open.
+        """
+        if (
+            not self.breaker_threshold
+            or stat is None
+            or stat.get("failures", 0) < self.breaker_threshold
+        ):
+            return "closed"
+
+        if now < stat["open_until"]:
+            _log.debug(
+                "breaker of %(endpoint)s: open (%(failures)s failures), skipped for %(left).1fs",
+                {
+                    "endpoint": endpoint,
+                    "failures": stat["failures"],
+                    "left": stat["open_until"] - now,
+                },
+            )
+            return "open"
+
+        _log.debug(
+            "breaker of %(endpoint)s: half-open (%(failures)s failures), trying it",
+            {"endpoint": endpoint, "failures": stat["failures"]},
+        )
+        return "half-open"
+
+    def _expired(self, stat: Dict[str, Any], now: float) -> bool:
+        return bool(now - stat.get("at", 0.0) > self.max_age)
+
+    def record(self, endpoint: str, ok: bool, latency: float) -> None:
+        """Record the outcome of a query, it's stored by commit()."""
+        with self.lock:
+            self.outcomes.append((endpoint, ok, latency, time.time()))
+
+    def commit(self) -> None:
+        """Store the outcomes recorded since the last commit."""
+        with self.lock:
+            outcomes, self.outcomes = self.outcomes, []
+        if not outcomes:
+            return
+        with open_cookie(self.path) as cookie:
+            if cookie is None:
+                return
+            for outcome in outcomes:
+                self._update(cookie.data, *outcome)
+
+    def _update(
+        self, stats: Dict[str, Any], endpoint: str, ok: bool, latency: float, at: float
+    ) -> None:
+        stat = stats.get(endpoint, {})
+        if self._expired(stat, at):
+            stat = {}
+        failures = 0 if ok else stat.get("failures", 0) + 1
+        stat.update(ok=ok, latency=latency, at=at, failures=failures)
+        if ok:
+            samples = stat.get("samples", []) + [latency]
+            del samples[: len(samples) - self.max_samples]
+            stat["samples"] = samples
+        if self.breaker_threshold and failures >= self.breaker_threshold:
+            _log.debug(
+                "breaker of %(endpoint)s: open after %(failures)s failures",
+                {"endpoint": endpoint, "failures": failures},
+            )
+            stat["open_until"] = at + self.breaker_cooldown
+        stats[endpoint] = stat
+
+    def expected_latency(self, endpoint: str, rank: float = 0.99) -> Optional[float]:
+        """Get a percentile (the 99th by default) of the recent latencies of
+        the endpoint loaded by plan(), None if there are not enough of them.
+        """
+        samples = sorted(self.stats.get(endpoint, {}).get("samples", []))
+        if len(samples) < self.min_samples:
+            return None
+        latency = percentile(samples, rank)
+        _log.debug(
+            "latency of %(endpoint)s: p50 %(p50).3fs p%(rank)d %(latency).3fs",
+            {
+                "endpoint": endpoint,
+                "p50": percentile(samples, 0.5),
+                "rank": rank * 100,
+                "latency": latency,
+            },
+        )
+        return latency
+
+
+class CapabilityStore:
+    """Version of Patroni on each endpoint and the features it supports.
+
+    The capabilities are stored when an answer of the endpoint gives its
+    version, they are used for `ttl` seconds so that the cluster checks don't
+    need to query /patroni. They are replaced as soon as an answer gives
+    another version.
+    """
+
+    def __init__(self, state_dir: str, ttl: float) -> None:
+        self.path = os.path.join(state_dir, "capabilities.state")
+        self.ttl = ttl
+
+    def lookup(self, endpoints: List[str]) -> Optional[Dict[str, Any]]:
+        """Get the capabilities of the first endpoint whose capabilities are
+        fresh.
+        """
+        with open_cookie(self.path, commit=False) as cookie:
+            if cookie is None:
+                return None
+            now = time.time()
+            for endpoint in endpoints:
+                capabilities = cookie.get(endpoint)
+                if (
+                    capabilities is not None
+                    and now - capabilities["checked_at"] <= self.ttl
+                ):
+                    _log.debug(
+                        "capabilities of %(endpoint)s: %(capabilities)s",
+                        {"endpoint": endpoint, "capabilities": capabilities},
+                    )
+                    return dict(capabilities)
+        return None
+
+    def observe(self, endpoint: str, version: str) -> None:
+        """Store the version of Patroni seen on an endpoint.
+
+        The state is only written when the version changed or the stored
+        capabilities are about to expire.
+        """
+        with open_cookie(self.path, commit=False) as cookie:
+            if cookie is None:
+                return
+            now = time.time()
+            capabilities = cookie.get(endpoint)
+            if capabilities is not None:
+                if capabilities["version"] == version:
+                    if now - capabilities["checked_at"] <= self.ttl / 2:
+                        return
+                else:
+                    _log.debug(
+                        "Patroni's version changed from %(old)s to %(new)s on %(endpoint)s",
+                        {
+                            "old": capabilities["version"],
+                            "new": version,
+                            "endpoint": endpoint,
+                        },
+                    )
+            cookie[endpoint] = {
+                "version": version,
+                "features": features(version),
+                "checked_at": now,
+            }
+            cookie.commit()
+
+
+class RateLimiter:
+    """Token buckets limiting the rate of the queries sent to each endpoint by
+    all the checks.
+
+    Each endpoint gets `rate` tokens per second, up to `burst` tokens, and a
+    query takes one token.
+    """
+
+    def __init__(self, state_dir: str, rate: float, burst: int) -> None:
+        self.path = os.path.join(state_dir, "ratelimit.state")
+        self.rate = rate
+        self.burst = burst
+
+    def acquire(self, endpoint: str, max_wait: Optional[float]) -> Optional[float]:
+        """Take a token for the endpoint and get the time to wait before
+        sending the query. None is returned, and no token taken, if the wait
+        would be longer than `max_wait`.
+        """
+        with open_cookie(self.path, commit=False) as cookie:
+            if cookie is None:
+                return 0.0
+            now = time.time()
+            bucket = cookie.get(endpoint, {"tokens": float(self.burst), "at": now})
+            tokens: float = min(
+                float(self.burst), bucket["tokens"] + (now - bucket["at"]) * self.rate
+            )
+            # the token is reserved now and available after the wait
+            wait = max((1 - tokens) / self.rate, 0.0)
+            if max_wait is not None and wait > max_wait:
+                return None
+            cookie[endpoint] = {"tokens": tokens - 1, "at": now}
+            cookie.commit()
+            return wait
+
+
+def parse_version(version: str) -> Tuple[int, ...]:
+    """Parse the major, minor and patch numbers of a version.
+
+    >>> parse_version("3.0.4")
+    (3, 0, 4)
+    """
+    return tuple(int(v) for v in version.split(".", 2))
+
+
+def features(version: str) -> Dict[str, bool]:
+    """Get the features available in a version of Patroni.
+
+    >>> features("3.0.3")
+    {'detailed_states': False}
+    >>> features("4.0.0")
+    {'detailed_states': True}
+    """
+    number = parse_version(version)
+    return {
+        # the "streaming" and "in archive recovery" states
+        "detailed_states": number
+        >= (3, 0, 4),
+    }
+
+
+def percentile(samples: List[float], rank: float) -> float:
+    """Nearest-rank percentile of sorted samples.
+
+    >>> percentile([1.0, 2.0, 3.0, 4.0], 0.5)
+    2.0
+    >>> percentile([1.0, 2.0, 3.0, 4.0], 0.99)
+    4.0
+    """
+    return samples[max(math.ceil(rank * len(samples)) - 1, 0)]
@@ -0,0 +1,306 @@
+"""HTTP transports used to query Patroni's REST API.
+
+The `requests` transport is the historical one. The `stdlib` transport only
+relies on http.client and ssl, it spares the import of requests and urllib3
+which is a large share of the start up time of the plugin.
+"""
+
+import http.client
+import json
+import os
+import ssl
+import threading
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Dict, List, Literal, Optional, Tuple, Union
+from urllib.parse import urlparse
+
+import attr
+
+from . import __version__, _log
+
+if TYPE_CHECKING:  # pragma: no cover
+    import requests
+
+TransportName = Literal["requests", "stdlib"]
+Cert = Optional[Union[str, Tuple[str, str]]]
+# connect and read timeouts
+Timeout = Optional[Tuple[float, float]]
+# scheme, netloc, cert, verify
+PoolKey = Tuple[str, str, Cert, Optional[str]]
+
+USER_AGENT = f"check_patroni/{__version__}"
+
+
+@attr.s(auto_attribs=True, frozen=True, slots=True)
+class Response:
+    status_code: int
+    text: str
+
+    def json(self) -> Any:
+        return json.loads(self.text)
+
+
+def pool_key(url: str, cert: Cert, verify: Optional[str]) -> PoolKey:
+    parsed = urlparse(url)
+    return (parsed.scheme, parsed.netloc, cert, verify)
+
+
+class Transport(ABC):
+    """Send GET requests to an endpoint, the connections are pooled per
+    endpoint and TLS parameters and kept alive for the whole process.
+    """
+
+    @abstractmethod
+    def get(
+        self, url: str, cert: Cert, verify: Optional[str], timeout: Timeout
+    ) -> Response:
+        """Send a GET request to the url and get the response."""
+
+
+class RequestsTransport(Transport):
+    def __init__(self) -> None:
+        self._sessions: Dict[PoolKey, "requests.Session"] = {}
+        self._lock = threading.Lock()
+
+    def session(
+        self, url: str, cert: Cert, verify: Optional[str]
+    ) -> "requests.Session":
+        """Get the pooled session used to query an endpoint with the given TLS
+        parameters.
+
+        The https sessions use the cached SSL context of these parameters
+        instead of letting urllib3 load the certificates for each connection.
+        """
+        import requests
+
+        key = pool_key(url, cert, verify)
+        with self._lock:
+            try:
+                return self._sessions[key]
+            except KeyError:
+                _log.debug(
+                    "Creating a new session for %(scheme)s://%(netloc)s",
+                    {"scheme": key[0], "netloc": key[1]},
+                )
+                session = self._sessions[key] = requests.Session()
+                if key[0] == "https":
+                    # the session has a context of its own, which no other
+                    # session or transport can alter
+                    context = build_ssl_context(cert, verify or _requests_ca_bundle())
+                    session.mount("https://", _ssl_context_adapter(context))
+                return session
+
+    def get(
+        self, url: str, cert: Cert, verify: Optional[str], timeout: Timeout
+    ) -> Response:
+        # the certificates are already loaded in the SSL context of the session,
+        # verify is given so that requests doesn't look for a CA bundle in the
+        # environment
+        r = self.session(url, cert, verify).get(
+            url, timeout=timeout, verify=verify or _requests_ca_bundle()
+        )
+        return Response(r.status_code, r.text)
+
+
+def _requests_ca_bundle() -> str:
+    """Get the CA bundle requests uses when none is given: the one of the
+    environment or certifi's.
+    """
+    from requests.utils import DEFAULT_CA_BUNDLE_PATH
+
+    return (
+        os.environ.get("REQUESTS_CA_BUNDLE")
+        or os.environ.get("CURL_CA_BUNDLE")
+        or DEFAULT_CA_BUNDLE_PATH
+    )
+
+
+def _ssl_context_adapter(context: ssl.SSLContext) -> "requests.adapters.HTTPAdapter":
+    """Build a requests adapter whose connections use the given SSL context."""
+    from requests.adapters import HTTPAdapter
+
+    class SSLContextAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args: Any, **kwargs: Any) -> None:
+            kwargs["ssl_context"] = context
+            super().init_poolmanager(*args, **kwargs)
+
+        def cert_verify(self, *args: Any, **kwargs: Any) -> None:
+            # don't let requests set the certificate files on the connections
+            pass
+
+        def build_connection_pool_key_attributes(
+            self, request: Any, verify: Any, cert: Any = None
+        ) -> Any:
+            # nor give them to urllib3, which would load them in the context
+            host_params, pool_kwargs = super().build_connection_pool_key_attributes(
+                request, verify, cert
+            )
+            kwargs: Dict[str, Any] = dict(pool_kwargs)
+            for name in ("ca_certs", "ca_cert_dir", "cert_file", "key_file"):
+                kwargs.pop(name, None)
+            return host_params, kwargs
+
+    return SSLContextAdapter()
+
+
+@lru_cache(maxsize=None)
+def ssl_context(cert: Cert, verify: Optional[str]) -> ssl.SSLContext:
+    """Get the SSL context of the given cert and verify parameters.
+
+    The contexts are cached: the CA bundle and the client key pair of a
+    ConnectionInfo are loaded once and used for all its endpoints.
+    """
+    return build_ssl_context(cert, verify)
+
+
+def build_ssl_context(cert: Cert, verify: Optional[str]) -> ssl.SSLContext:
+    """Build an SSL context with the same semantics as requests' cert and
+    verify parameters.
+    """
+    context = ssl.create_default_context(cafile=verify)
+    if isinstance(cert, str):
+        context.load_cert_chain(cert)
+    elif cert is not None and cert[0] is not None:
+        context.load_cert_chain(cert[0], cert[1])
+    return context
+
+
+class HTTPSConnection(http.client.HTTPSConnection):
+    """An HTTPS connection which resumes a previous TLS session."""
+
+    def __init__(
+        self,
+        host: str,
+        *,
+        context: ssl.SSLContext,
+        tls_session: Optional[ssl.SSLSession] = None,
+    ) -> None:
+        super().__init__(host, context=context)
+        self.ssl_context = context
+        self.tls_session = tls_session
+        self.session_reused = False
+
+    def connect(self) -> None:
+        http.client.HTTPConnection.connect(self)
+        self.sock = self.ssl_context.wrap_socket(
+            self.sock, server_hostname=self.host, session=self.tls_session
+        )
+        self.session_reused = bool(self.sock.session_reused)
+        _log.debug(
+            "TLS connection to %(host)s, session reused: %(reused)s",
+            {"host": self.host, "reused": self.session_reused},
+        )
+
+    def close(self) -> None:
+        # http.client closes the connection as soon as it knows the server
+        # will, keep the session for the next connection
+        if isinstance(self.sock, ssl.SSLSocket) and self.sock.session is not None:
+            self.tls_session = self.sock.session
+        super().close()
+
+
+class StdlibTransport(Transport):
+    # idle connections kept for each endpoint
+    max_idle = 4
+
+    def __init__(self) -> None:
+        self._idle: Dict[PoolKey, List[http.client.HTTPConnection]] = {}
+        # the last TLS session of each endpoint, they are resumed by the new
+        # connections to skip the full handshake
+        self._tls_sessions: Dict[PoolKey, ssl.SSLSession] = {}
+        self._lock = threading.Lock()
+
+    def _checkout(self, key: PoolKey) -> Tuple[http.client.HTTPConnection, bool]:
+        """Get an idle connection to the endpoint or a new one, the boolean
+        tells whether the connection is reused.
+        """
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+            tls_session = self._tls_sessions.get(key)
+
+        scheme, netloc, cert, verify = key
+        conn: http.client.HTTPConnection
+        if scheme == "https":
+            conn = HTTPSConnection(
+                netloc, context=ssl_context(cert, verify), tls_session=tls_session
+            )
+        else:
+            conn = http.client.HTTPConnection(netloc)
+        return conn, False
+
+    def _checkin(self, key: PoolKey, conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            if isinstance(conn, HTTPSConnection):
+                if isinstance(conn.sock, ssl.SSLSocket) and conn.sock.session:
+                    conn.tls_session = conn.sock.session
+                if conn.tls_session is not None:
+                    self._tls_sessions[key] = conn.tls_session
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def get(
+        self, url: str, cert: Cert, verify: Optional[str], timeout: Timeout
+    ) -> Response:
+        parsed = urlparse(url)
+        path = parsed.path or "/"
+        if parsed.query:
+            path = f"{path}?{parsed.query}"
+
+        key = pool_key(url, cert, verify)
+        conn, reused = self._checkout(key)
+        try:
+            try:
+                r = self._request(conn, path, timeout)
+            except (http.client.RemoteDisconnected, ConnectionError):
+                if not reused:
+                    raise
+                # the server closed the idle connection, try with a new one
+                conn.close()
+                r = self._request(conn, path, timeout)
+        except Exception:
+            conn.close()
+            raise
+        self._checkin(key, conn)
+        _log.debug(
+            "GET %(url)s: status %(status)s", {"url": url, "status": r.status_code}
+        )
+        return r
+
+    def _request(
+        self, conn: http.client.HTTPConnection, path: str, timeout: Timeout
+    ) -> Response:
+        if conn.sock is None:
+            conn.timeout = timeout[0] if timeout is not None else None
+            conn.connect()
+        assert conn.sock is not None
+        conn.sock.settimeout(timeout[1] if timeout is not None else None)
+        conn.request("GET", path, headers={"User-Agent": USER_AGENT, "Accept": "*/*"})
+        resp = conn.getresponse()
+        body = resp.read()
+        return Response(resp.status, body.decode("utf-8", errors="replace"))
+
+
+_transports: Dict[str, Transport] = {}
+_transports_lock = threading.Lock()
+
+
+def get_transport(name: TransportName) -> Transport:
+    """Get the transport shared by all the resources of the process."""
+    with _transports_lock:
+        try:
+            return _transports[name]
+        except KeyError:
+            pass
+        transport: Transport
+        if name == "stdlib":
+            transport = StdlibTransport()
+        else:
+            transport = RequestsTransport()
+        _transports[name] = transport
+        return transport
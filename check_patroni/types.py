@@ -1,28 +1,119 @@
 import json
-from functools import lru_cache
-from typing import Any, Callable, List, Literal, Optional, Tuple, Union
+import math
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from functools import partial
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Literal,
+    Optional,
+    Tuple,
+    Union,
+)
 from urllib.parse import urlparse
 
 import attr
 import nagiosplugin
-import requests
 
-from . import _log
+from . import _log, _output
+from .cache import ResponseCache, SingleFlight
+from .state import CapabilityStore, EndpointsState, RateLimiter, features
+from .transport import Response, TransportName, get_transport
 
 SyncType = Literal["any", "sync", "quorum"]
+OutputFormat = Literal["nagios", "json"]
 
 
-class APIError(requests.exceptions.RequestException):
+class APIError(IOError):
     """This exception is raised when the rest api could
     be reached but we got a http status code different from 200.
     """
 
 
+class RateLimited(nagiosplugin.CheckError):
+    """This exception is raised when some endpoints could not be queried
+    because their rate limit was reached.
+    """
+
+
 @attr.s(auto_attribs=True, frozen=True, slots=True)
 class ConnectionInfo:
     endpoints: List[str] = ["http://127.0.0.1:8008"]
     cert: Optional[Union[str, Tuple[str, str]]] = None
     ca_cert: Optional[str] = None
+    fanout: int = 1
+    transport: TransportName = "requests"
+    state_dir: Optional[str] = None
+    breaker_threshold: int = 0
+    breaker_cooldown: float = 30.0
+    adaptive_timeouts: bool = False
+    hedge_delay: Optional[Union[float, Literal["auto"]]] = None
+    cache_max_age: float = 0.0
+    capabilities_ttl: float = 3600.0
+    single_flight_wait: float = 0.0
+    rate_limit: float = 0.0
+    rate_burst: int = 5
+
+
+@attr.s(auto_attribs=True, frozen=True, slots=True)
+class Deadline:
+    """The time budget of the API queries of a check.
+
+    The budget is a share of the plugin's timeout so that all the endpoints
+    can be tried before nagiosplugin aborts the check. A timeout of 0 disables
+    the deadline.
+    """
+
+    timeout: float
+    started: float = attr.ib(factory=time.monotonic)
+
+    # share of the plugin's timeout available to the API queries
+    budget_ratio = 0.9
+    # share of an attempt's timeout used to establish the connection
+    connect_ratio = 1 / 3
+    # with adaptive timeouts: multiple of the expected latency allowed to an
+    # attempt and minimal duration of an attempt
+    latency_slack = 3.0
+    min_attempt = 0.1
+
+    def remaining(self) -> Optional[float]:
+        """Return the time left in seconds or None if there is no deadline."""
+        if not self.timeout:
+            return None
+        elapsed = time.monotonic() - self.started
+        return max(self.timeout * self.budget_ratio - elapsed, 0.0)
+
+    def attempt_timeout(
+        self, attempts: int, expected: Optional[float] = None
+    ) -> Optional[Tuple[float, float]]:
+        """Split the remaining time between the attempts left and return the
+        connect and read timeouts of the next one.
+
+        When the `expected` latency of the endpoint is known, the attempt gets
+        a few times this latency instead, within the remaining time.
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return None
+        budget = remaining / max(attempts, 1)
+        if expected is not None:
+            budget = min(
+                remaining, max(expected * self.latency_slack, self.min_attempt)
+            )
+        connect = budget * self.connect_ratio
+        return connect, budget - connect
+
+
+# endpoint, response, error
+Answer = Tuple[str, Optional[Response], Optional[Exception]]
 
 
 @attr.s(auto_attribs=True, frozen=True, slots=True)
@@ -30,77 +121,685 @@ class Parameters:
     connection_info: ConnectionInfo
     timeout: int
     verbose: int
+    deadline: Optional[Deadline] = None
+    output: OutputFormat = "nagios"
+
+
+# endpoints, service
+SnapshotKey = Tuple[Tuple[str, ...], str]
+
+
+class Snapshot:
+    """Responses of the API shared by the resources evaluated together.
+
+    Each service of the same endpoints is queried once, its response or error
+    is given to all the resources which need it. The outcomes of the queries
+    are stored in the state directory once, when the snapshot is closed.
+    """
+
+    def __init__(self) -> None:
+        self._responses: Dict[SnapshotKey, Tuple[Any, Optional[Exception]]] = {}
+        self._locks: Dict[SnapshotKey, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._endpoints_states: Dict[Tuple[str, int, float], EndpointsState] = {}
+
+    def endpoints_state(self, conn_info: ConnectionInfo) -> EndpointsState:
+        """Get the state of the endpoints shared by the queries of the
+        snapshot.
+        """
+        assert conn_info.state_dir is not None
+        key = (
+            conn_info.state_dir,
+            conn_info.breaker_threshold,
+            conn_info.breaker_cooldown,
+        )
+        with self._lock:
+            state = self._endpoints_states.get(key)
+            if state is None:
+                state = self._endpoints_states[key] = EndpointsState(*key)
+        return state
+
+    def commit(self) -> None:
+        """Store the outcomes of the queries sent in the snapshot."""
+        with self._lock:
+            states = list(self._endpoints_states.values())
+        for state in states:
+            state.commit()
+
+    def fetch(
+        self, endpoints: List[str], service: str, fetch: Callable[[], Any]
+    ) -> Any:
+        key = (tuple(endpoints), service)
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            try:
+                data, error = self._responses[key]
+            except KeyError:
+                try:
+                    data, error = fetch(), None
+                except Exception as e:
+                    data, error = None, e
+                self._responses[key] = data, error
+            else:
+                _log.debug(
+                    "using the response to %(service)s of the snapshot",
+                    {"service": service},
+                )
+        if error is not None:
+            raise error
+        return data
+
+    def store(self, endpoints: List[str], service: str, data: Any) -> None:
+        """Give a response obtained beforehand to the resources."""
+        self._responses[(tuple(endpoints), service)] = data, None
+
+    def prefetch(
+        self, endpoints: List[str], service: str, fetch: Callable[[], Any]
+    ) -> None:
+        """Fetch a service ahead of the resources, its error is kept for
+        them.
+        """
+        try:
+            self.fetch(endpoints, service, fetch)
+        except Exception:
+            pass
+
+
+_snapshot: ContextVar[Optional[Snapshot]] = ContextVar("snapshot", default=None)
+
+
+@contextmanager
+def shared_responses() -> Iterator[Snapshot]:
+    """Share the responses of the API between the resources probed in the
+    context.
+    """
+    snapshot = Snapshot()
+    token = _snapshot.set(snapshot)
+    try:
+        yield snapshot
+    finally:
+        _snapshot.reset(token)
+        snapshot.commit()
 
 
 @attr.s(auto_attribs=True, eq=False, slots=True)
 class PatroniResource(nagiosplugin.Resource):
     conn_info: ConnectionInfo
+    deadline: Optional[Deadline] = None
+    # answer of has_detailed_states(), kept for the lifetime of the resource
+    _detailed_states: Optional[bool] = attr.ib(default=None, init=False, repr=False)
+
+    # hedge delay used in auto mode until the latency of the endpoint is known
+    default_hedge_delay = 0.2
+    # share of the time left a query may wait for the rate limiter
+    max_throttle_ratio = 0.5
+
+    def services(self) -> List[str]:
+        """The services of the API needed by probe(), they are fetched
+        concurrently before the resources of a PatroniCheck are probed.
+        """
+        return []
+
+    def detailed_states_services(self) -> List[str]:
+        """The services needed by has_detailed_states(): none when the
+        capabilities of an endpoint are known.
+        """
+        store = self._capabilities()
+        if store is not None and store.lookup(self.conn_info.endpoints) is not None:
+            return []
+        return ["patroni"]
 
     def rest_api(self, service: str) -> Any:
-        """Try to connect to all the provided endpoints for the requested service"""
-        for endpoint in self.conn_info.endpoints:
-            cert: Optional[Union[Tuple[str, str], str]] = None
-            verify: Optional[Union[str, bool]] = None
-            if urlparse(endpoint).scheme == "https":
-                if self.conn_info.cert is not None:
-                    # we can have: a key + a cert or a single file with key and cert.
-                    cert = self.conn_info.cert
-                if self.conn_info.ca_cert is not None:
-                    verify = self.conn_info.ca_cert
+        """Try to connect to all the provided endpoints for the requested service
 
-            _log.debug(
-                "Trying to connect to %(endpoint)s/%(service)s with cert: %(cert)s verify: %(verify)s",
-                {
-                    "endpoint": endpoint,
-                    "service": service,
-                    "cert": cert,
-                    "verify": verify,
-                },
+        Within shared_responses(), the service is only queried once. The
+        cluster wide services are answered from the response cache while
+        it's fresh (see --cache-max-age). When the rate limit of the endpoints
+        is reached, the last response stored is used.
+        """
+        snapshot = _snapshot.get()
+        if snapshot is not None:
+            return snapshot.fetch(
+                self.conn_info.endpoints, service, partial(self._rest_api, service)
+            )
+        return self._rest_api(service)
+
+    def _rest_api(self, service: str) -> Any:
+        cache = self._response_cache(service)
+        if (
+            cache is not None
+            and self.conn_info.cache_max_age
+            and service in ResponseCache.services
+        ):
+            cached = cache.get(self.conn_info.endpoints, service)
+            if cached is not None:
+                return cached.data
+
+        try:
+            data = self._coalesced_fetch(service)
+        except RateLimited:
+            last = None
+            if cache is not None:
+                last = cache.load(self.conn_info.endpoints, service)
+            if last is None:
+                raise
+            _output.warning(
+                "Rate limit of the API reached, using the response to %(service)s cached %(age).1fs ago",
+                {"service": service, "age": last.age()},
+            )
+            return last.data
+        if cache is not None:
+            cache.store(self.conn_info.endpoints, service, data)
+        return data
+
+    def _coalesced_fetch(self, service: str) -> Any:
+        """Fetch the service or use the response of a concurrent check which
+        is sending the same query (see --single-flight-wait).
+        """
+        if self.conn_info.state_dir is None or not self.conn_info.single_flight_wait:
+            return self._fetch(service)
+        flight = SingleFlight(
+            self.conn_info.state_dir, self.conn_info.single_flight_wait
+        )
+        wait = flight.wait
+        if self.deadline is not None:
+            remaining = self.deadline.remaining()
+            if remaining is not None:
+                wait = min(wait, remaining)
+        return flight.run(
+            self.conn_info.endpoints, service, partial(self._fetch, service), wait
+        )
+
+    def _fetch(self, service: str) -> Any:
+        if self.conn_info.state_dir is None:
+            return self._fetch_from(service, self.conn_info.endpoints, None)
+        state = self._endpoints_state()
+        try:
+            return self._fetch_from(
+                service, state.plan(self.conn_info.endpoints), state
             )
+        finally:
+            # out of a snapshot, the outcomes are stored by each fetch
+            if _snapshot.get() is None:
+                state.commit()
 
+    def _fetch_from(
+        self, service: str, endpoints: List[str], state: Optional[EndpointsState]
+    ) -> Any:
+        if len(endpoints) > 1 and (
+            self.conn_info.fanout > 1 or self.conn_info.hedge_delay is not None
+        ):
+            return self._race(service, endpoints, state)
+
+        limited = False
+        for i, endpoint in enumerate(endpoints):
+            if not self._throttle(endpoint):
+                limited = True
+                continue
+            timeout = self._attempt_timeout(len(endpoints) - i, endpoint, state)
             try:
-                r = requests.get(f"{endpoint}/{service}", verify=verify, cert=cert)
+                r = self._query(endpoint, service, timeout, state)
             except Exception as e:
                 _log.debug(e)
                 continue
-            # The status code is already displayed by urllib3
-            _log.debug(
-                "api call data: %(data)s", {"data": r.text if r.text else "<Empty>"}
+            return self._decode(endpoint, service, r)
+        raise self._failure(limited)
+
+    def _failure(self, limited: bool) -> nagiosplugin.CheckError:
+        if limited:
+            return RateLimited(
+                "Connection failed or rate limit reached for all provided endpoints"
             )
+        return nagiosplugin.CheckError("Connection failed for all provided endpoints")
+
+    def _race(
+        self, service: str, endpoints: List[str], state: Optional[EndpointsState]
+    ) -> Any:
+        """Query up to `fanout` endpoints concurrently and return the first
+        successful answer.
+
+        A new endpoint is queried each time one fails. With a hedge delay, a
+        new endpoint is also queried each time no answer arrived within the
+        delay. The endpoints whose rate limit is reached are skipped rather
+        than waited for, not to delay the other queries. The queries run in
+        daemon threads, those still running when an answer is found are
+        abandoned.
+        """
+        hedge_delay = self._hedge_delay(endpoints[0], state)
+        left = len(endpoints)
+        candidates = iter(endpoints)
+        answers: "queue.Queue[Answer]" = queue.Queue()
+        api_error: Optional[APIError] = None
+        limited = False
+
+        def query(endpoint: str, timeout: Optional[Tuple[float, float]]) -> None:
+            try:
+                r = self._query(endpoint, service, timeout, state)
+                answers.put((endpoint, r, None))
+            except Exception as e:
+                answers.put((endpoint, None, e))
 
-            if r.status_code != 200:
-                raise APIError(
-                    f"Failed to connect to {endpoint}/{service} status code {r.status_code}"
+        def submit() -> int:
+            nonlocal left, limited
+            for endpoint in candidates:
+                if not self._throttle(endpoint, block=False):
+                    limited = True
+                    left -= 1
+                    continue
+                # the queries are sent by batches of fanout endpoints
+                timeout = self._attempt_timeout(
+                    math.ceil(left / self.conn_info.fanout), endpoint, state
                 )
+                left -= 1
+                threading.Thread(
+                    target=query, args=(endpoint, timeout), daemon=True
+                ).start()
+                return 1
+            return 0
 
+        running = sum(submit() for _ in range(self.conn_info.fanout))
+        while running:
+            try:
+                endpoint, r, error = answers.get(timeout=hedge_delay)
+            except queue.Empty:
+                _log.debug(
+                    "no answer after %(delay).3fs, hedging the request",
+                    {"delay": hedge_delay},
+                )
+                running += submit()
+                continue
+            running -= 1
+            if r is None:
+                _log.debug(error)
+                running += submit()
+                continue
             try:
-                return r.json()
-            except (json.JSONDecodeError, ValueError):
-                return None
-        raise nagiosplugin.CheckError("Connection failed for all provided endpoints")
+                return self._decode(endpoint, service, r)
+            except APIError as e:
+                # another endpoint could still give us a valid answer
+                api_error = e
+                running += submit()
+
+        if api_error is not None:
+            raise api_error
+        raise self._failure(limited)
+
+    def _hedge_delay(
+        self, preferred: str, state: Optional[EndpointsState]
+    ) -> Optional[float]:
+        """Get the delay after which the request is sent to the next endpoint,
+        auto uses the 95th percentile of the preferred endpoint's latency.
+        """
+        delay = self.conn_info.hedge_delay
+        if delay != "auto":
+            return delay
+        if state is not None:
+            latency = state.expected_latency(preferred, 0.95)
+            if latency is not None:
+                return latency
+        return self.default_hedge_delay
+
+    def _throttle(self, endpoint: str, block: bool = True) -> bool:
+        """Take a token of the endpoint's rate limiter, waiting for it within
+        the deadline if `block` is set. False is returned if the endpoint can't
+        be queried.
+        """
+        if self.conn_info.state_dir is None or not self.conn_info.rate_limit:
+            return True
+        limiter = RateLimiter(
+            self.conn_info.state_dir,
+            self.conn_info.rate_limit,
+            self.conn_info.rate_burst,
+        )
+        max_wait = None
+        if not block:
+            max_wait = 0.0
+        elif self.deadline is not None:
+            remaining = self.deadline.remaining()
+            if remaining is not None:
+                max_wait = remaining * self.max_throttle_ratio
+        wait = limiter.acquire(endpoint, max_wait)
+        if wait is None:
+            _log.debug(
+                "rate limit of %(endpoint)s reached, skipping it",
+                {"endpoint": endpoint},
+            )
+            return False
+        if wait > 0:
+            _output.warning(
+                "Rate limit of %(endpoint)s reached, waited %(wait).2fs",
+                {"endpoint": endpoint, "wait": wait},
+            )
+            time.sleep(wait)
+        return True
+
+    def _attempt_timeout(
+        self, attempts: int, endpoint: str, state: Optional[EndpointsState]
+    ) -> Optional[Tuple[float, float]]:
+        """Get the connect and read timeouts of the next attempt, raise a
+        CheckError if the deadline has been reached.
+
+        With adaptive timeouts, the timeout is derived from the latency
+        observed on the endpoint instead of an even share of the time left.
+        """
+        if self.deadline is None:
+            return None
+        expected = None
+        if self.conn_info.adaptive_timeouts and state is not None:
+            expected = state.expected_latency(endpoint)
+        timeout = self.deadline.attempt_timeout(attempts, expected)
+        if timeout is not None and sum(timeout) <= 0:
+            raise nagiosplugin.CheckError(
+                "Deadline reached before all the provided endpoints could be queried"
+            )
+        return timeout
+
+    def _query(
+        self,
+        endpoint: str,
+        service: str,
+        timeout: Optional[Tuple[float, float]],
+        state: Optional[EndpointsState] = None,
+    ) -> Response:
+        cert: Optional[Union[Tuple[str, str], str]] = None
+        verify: Optional[str] = None
+        if urlparse(endpoint).scheme == "https":
+            if self.conn_info.cert is not None:
+                # we can have: a key + a cert or a single file with key and cert.
+                cert = self.conn_info.cert
+            if self.conn_info.ca_cert is not None:
+                verify = self.conn_info.ca_cert
+
+        _log.debug(
+            "Trying to connect to %(endpoint)s/%(service)s with cert: %(cert)s verify: %(verify)s timeout: %(timeout)s",
+            {
+                "endpoint": endpoint,
+                "service": service,
+                "cert": cert,
+                "verify": verify,
+                "timeout": timeout,
+            },
+        )
+
+        transport = get_transport(self.conn_info.transport)
+        start = time.monotonic()
+        try:
+            r = transport.get(f"{endpoint}/{service}", cert, verify, timeout)
+        except Exception:
+            if state is not None:
+                state.record(endpoint, False, time.monotonic() - start)
+            raise
+        if state is not None:
+            state.record(endpoint, True, time.monotonic() - start)
+        return r
+
+    def _endpoints_state(self) -> EndpointsState:
+        """Get the state of the endpoints, shared by the snapshot if any."""
+        assert self.conn_info.state_dir is not None
+        snapshot = _snapshot.get()
+        if snapshot is not None:
+            return snapshot.endpoints_state(self.conn_info)
+        return EndpointsState(
+            self.conn_info.state_dir,
+            self.conn_info.breaker_threshold,
+            self.conn_info.breaker_cooldown,
+        )
+
+    def _response_cache(self, service: str) -> Optional[ResponseCache]:
+        """Get the cache if the responses to the service are stored: those of
+        the cluster wide services with --cache-max-age, all of them with
+        --rate-limit.
+        """
+        if self.conn_info.state_dir is None:
+            return None
+        if self.conn_info.rate_limit or (
+            self.conn_info.cache_max_age and service in ResponseCache.services
+        ):
+            return ResponseCache(self.conn_info.state_dir, self.conn_info.cache_max_age)
+        return None
+
+    def _decode(self, endpoint: str, service: str, r: Response) -> Any:
+        # The status code is already displayed by the transport
+        _log.debug("api call data: %(data)s", {"data": r.text if r.text else "<Empty>"})
+
+        if r.status_code != 200:
+            raise APIError(
+                f"Failed to connect to {endpoint}/{service} status code {r.status_code}"
+            )
+
+        try:
+            data = r.json()
+        except (json.JSONDecodeError, ValueError):
+            return None
+        self._observe(endpoint, data)
+        return data
+
+    def _capabilities(self) -> Optional[CapabilityStore]:
+        if self.conn_info.state_dir is None or not self.conn_info.capabilities_ttl:
+            return None
+        return CapabilityStore(
+            self.conn_info.state_dir, self.conn_info.capabilities_ttl
+        )
+
+    def _observe(self, endpoint: str, data: Any) -> None:
+        """Keep the version of Patroni given by the node services."""
+        store = self._capabilities()
+        if store is None or not isinstance(data, dict):
+            return
+        version = data.get("patroni", {}).get("version")
+        if isinstance(version, str):
+            try:
+                store.observe(endpoint, version)
+            except ValueError as e:
+                _log.debug(e)
+
+    async def arest_api(self, service: str) -> Any:
+        """Awaitable version of rest_api.
+
+        The query is run by the loop's default executor so that the queries of
+        several resources, or several clusters, can run concurrently.
+        """
+        # asyncio is only imported by the callers running an event loop
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        # the executor's threads see the snapshot of the caller
+        return await loop.run_in_executor(
+            None, copy_context().run, partial(self.rest_api, service)
+        )
+
+    async def aprobe(self) -> List[nagiosplugin.Metric]:
+        """Awaitable version of probe."""
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, copy_context().run, lambda: list(self.probe())
+        )
 
-    @lru_cache(maxsize=None)
     def has_detailed_states(self) -> bool:
+        if self._detailed_states is None:
+            self._detailed_states = self._has_detailed_states()
+        return self._detailed_states
+
+    def _has_detailed_states(self) -> bool:
         # get patroni's version to find out if the "streaming" and "in archive recovery" states are available
-        patroni_item_dict = self.rest_api("patroni")
+        capabilities = None
+        store = self._capabilities()
+        if store is not None:
+            capabilities = store.lookup(self.conn_info.endpoints)
+        if capabilities is None:
+            patroni_item_dict = self.rest_api("patroni")
+            version = patroni_item_dict["patroni"]["version"]
+            capabilities = {"version": version, "features": features(version)}
 
-        if tuple(
-            int(v) for v in patroni_item_dict["patroni"]["version"].split(".", 2)
-        ) >= (3, 0, 4):
+        if capabilities["features"]["detailed_states"]:
             _log.debug(
                 "Patroni's version is %(version)s, more detailed states can be used to check for the health of replicas.",
-                {"version": patroni_item_dict["patroni"]["version"]},
+                {"version": capabilities["version"]},
             )
 
             return True
 
         _log.debug(
             "Patroni's version is %(version)s, the running state and the timelines must be used to check for the health of replicas.",
-            {"version": patroni_item_dict["patroni"]["version"]},
+            {"version": capabilities["version"]},
         )
         return False
 
 
+async def probe_all(
+    resources: Iterable[PatroniResource],
+) -> List[List[nagiosplugin.Metric]]:
+    """Probe the resources concurrently, the metrics are returned in the order
+    of the resources.
+    """
+    import asyncio
+
+    return await asyncio.gather(*(r.aprobe() for r in resources))
+
+
+def prefetch(resources: Iterable[nagiosplugin.Resource]) -> None:
+    """Fetch the services needed by the resources concurrently, each one
+    once, into the current snapshot.
+
+    The queries run in daemon threads, like the concurrent queries of
+    rest_api, so that a hung query doesn't prevent the plugin from exiting
+    on timeout.
+    """
+    snapshot = _snapshot.get()
+    assert snapshot is not None, "prefetch() must be called in shared_responses()"
+    needed: Dict[SnapshotKey, PatroniResource] = {}
+    for resource in resources:
+        if isinstance(resource, PatroniResource):
+            for service in resource.services():
+                key = (tuple(resource.conn_info.endpoints), service)
+                needed.setdefault(key, resource)
+    if len(needed) < 2:
+        # nothing to gain, the resource will fetch it
+        return
+
+    _log.debug(
+        "prefetching %(services)s concurrently",
+        {"services": ", ".join(service for _, service in needed)},
+    )
+    threads = [
+        threading.Thread(
+            # the queries record the outcomes in the snapshot
+            target=copy_context().run,
+            args=(
+                snapshot.prefetch,
+                resource.conn_info.endpoints,
+                service,
+                partial(resource._rest_api, service),
+            ),
+            daemon=True,
+        )
+        for (_, service), resource in needed.items()
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+class ProbedResource(nagiosplugin.Resource):
+    """The outcome of the probe of a resource, run ahead by a PatroniCheck."""
+
+    def __init__(
+        self,
+        resource: nagiosplugin.Resource,
+        metrics: List[nagiosplugin.Metric],
+        error: Optional[BaseException],
+    ) -> None:
+        self.resource = resource
+        self.metrics = metrics
+        self.error = error
+
+    @property
+    def name(self) -> str:
+        return self.resource.name  # type: ignore[no-any-return]
+
+    def probe(self) -> List[nagiosplugin.Metric]:
+        if self.error is not None:
+            raise self.error
+        return self.metrics
+
+
+class PatroniCheck(nagiosplugin.Check):
+    """A check whose resources share the responses of the API, the services
+    they need are fetched concurrently before they are probed.
+
+    When the check has several resources, they are probed concurrently, each
+    one within its deadline. The results are evaluated in the order of the
+    resources.
+    """
+
+    resources: List[nagiosplugin.Resource]
+
+    def __call__(self) -> None:
+        if _snapshot.get() is not None:
+            self._run()
+            return
+        with shared_responses():
+            self._run()
+
+    def _run(self) -> None:
+        prefetch(self.resources)
+        if len(self.resources) < 2:
+            super().__call__()
+            return
+
+        resources = self.resources
+        self.resources = self._probe_all(resources)
+        try:
+            super().__call__()
+        finally:
+            self.resources = resources
+
+    @staticmethod
+    def _probe_all(
+        resources: List[nagiosplugin.Resource],
+    ) -> List[nagiosplugin.Resource]:
+        """Probe the resources in daemon threads, the resources which are
+        still being probed when their deadline is reached are unknown.
+        """
+        outcomes: List[Optional[ProbedResource]] = [None] * len(resources)
+
+        def probe(i: int, resource: nagiosplugin.Resource) -> None:
+            try:
+                outcomes[i] = ProbedResource(resource, list(resource.probe()), None)
+            except BaseException as e:
+                outcomes[i] = ProbedResource(resource, [], e)
+
+        threads = []
+        for i, resource in enumerate(resources):
+            # the threads see the snapshot of the check
+            context = copy_context()
+            thread = threading.Thread(
+                target=context.run, args=(probe, i, resource), daemon=True
+            )
+            thread.start()
+            threads.append(thread)
+
+        probed: List[nagiosplugin.Resource] = []
+        for i, (thread, resource) in enumerate(zip(threads, resources)):
+            deadline = getattr(resource, "deadline", None)
+            thread.join(deadline.remaining() if deadline is not None else None)
+            outcome = outcomes[i]
+            if outcome is None:
+                outcome = ProbedResource(
+                    resource,
+                    [],
+                    nagiosplugin.CheckError(
+                        f"Deadline reached before {resource.name} could be probed"
+                    ),
+                )
+            probed.append(outcome)
+        return probed
+
+
 HandleUnknown = Callable[[nagiosplugin.Summary, nagiosplugin.Results], Any]
 
 
@@ -97,6 +97,75 @@ Several options are available:
   * `--cert_file`: your certificate or the concatenation of your certificate and private key
   * `--key_file`: your private key (optional)
 
+## State directory
+
+When a directory is given with `--state-dir`, check_patroni keeps some state
+between its invocations in it. The state files are locked, so they can be
+shared by all the checks of a server:
+
+* `endpoints.state`: the outcome and latency of the last query sent to each
+  endpoint, written once at the end of each check and forgotten after 10
+  minutes. The endpoints which answered recently are tried first, the fastest
+  first, and those which failed are tried last. With `--breaker-threshold`,
+  an endpoint which failed that many times in a row is skipped during
+  `--breaker-cooldown` seconds, then a single check is allowed to try it again,
+  before the other endpoints. While the breakers of all the endpoints are open,
+  the checks are UNKNOWN without querying them.
+  The state of the breakers is displayed with `-vvv`. With
+  `--adaptive-timeouts`, the latencies of the last successful queries are
+  used to give each endpoint a timeout matching its own latency, within the
+  `--timeout` of the check.
+* `responses/`: with `--cache-max-age`, the responses of the cluster wide
+  services (`/cluster` and `/config`) are stored there and used by the other
+  checks of the same endpoints while they are not older than the given number
+  of seconds. The cluster checks scheduled together then cost a single query.
+  The responses are replaced atomically and read without a lock.
+* `capabilities.state`: the version of Patroni last seen on each endpoint and
+  the features it supports. The cluster checks which depend on the version use
+  it instead of querying `/patroni` for `--capabilities-ttl` seconds. The
+  version is updated each time a node service answers with another one.
+* `flights/`: with `--single-flight-wait`, the checks sending the same query
+  at the same time take a lock there. The first one sends the query and stores
+  the response, the others wait for it up to the given number of seconds. They
+  send the query themselves if the first check failed or took too long.
+* `ratelimit.state`: with `--rate-limit`, a token bucket per endpoint limits
+  the number of queries per second sent by all the checks, so that a burst of
+  checks doesn't slow down Patroni's HA loop. A check which hits the limit
+  waits for its turn within its timeout, unless it queries several endpoints
+  concurrently (`--fan-out`, `--hedge-delay`): it then skips the endpoint.
+  Otherwise, it uses the last response
+  stored in `responses/` or fails if there is none. The output of the check
+  tells when it waited or used a stored response. The limit is usually set in
+  the config file:
+  ```
+  [options]
+  state_dir = /var/tmp/check_patroni
+  rate_limit = 2
+  rate_burst = 5
+  ```
+
+## JSON output
+
+With `--output json`, the result of a service is printed as a single JSON
+object instead of the output of a Nagios plugin, for tools which would
+otherwise have to parse the performance data. The exit code is the same.
+
+```
+$ check_patroni -e https://10.20.199.3:8008 --output json cluster_node_count -w 4:
+{"service": "cluster_node_count", "name": "CLUSTERNODECOUNT", "state": "warning",
+ "exitcode": 1, "summary": "members is 3 (outside range 4:)", "metrics": [
+ {"name": "members", "value": 3, "uom": null, "min": null, "max": null,
+  "context": "members", "warning": "4:", "critical": null, "state": "warning",
+  "hint": "outside range 4:"}, ...],
+ "timing": {"duration": 0.012, "started_at": 1700000000.0}, "logs": []}
+```
+
+Each metric comes with its context, the thresholds of the context if it has
+any and the state it was given. The time taken by the check, in seconds, is
+given in `timing`. The messages printed with `-v` are given in `logs`. With
+`multi`, the object gives the worst state and the object of each service in
+`services`.
+
 ## Shell completion
 
 We use the [click] library which supports shell completion natively.
@@ -144,6 +213,13 @@ readme "### cluster_node_count"
 helpme  cluster_node_count
 readme "## Node services"
 readme
+readme "The node services query the API of the node they check, the endpoints given"
+readme "with \`-e\` should point to this node. With \`--member\`, \`node_is_primary\`,"
+readme "\`node_is_replica\`, \`node_is_pending_restart\` and \`node_tl_has_changed\` read"
+readme "the state of the member from the \`cluster\` service instead, so that the"
+readme "endpoints of any member can be used. Combined with \`--cache-max-age\`, all the"
+readme "members of a cluster can be checked with a single query."
+readme
 readme "### node_is_alive"
 helpme node_is_alive
 readme "### node_is_pending_restart"
@@ -158,6 +234,53 @@ readme "### node_patroni_version"
 helpme node_patroni_version
 readme "### node_tl_has_changed"
 helpme node_tl_has_changed
+readme "## Combined services"
+readme
+readme "### multi"
+helpme multi
+readme "### batch"
+helpme batch
+readme "### fleet"
+helpme fleet
+cat << '_EOF_' >> $README
+For example, to check the leader of two clusters and the number of nodes of
+one of them:
+
+```
+[options]
+timeout = 5
+
+[options.cluster_has_leader]
+
+[cluster.prod]
+endpoints = https://10.20.199.3:8008, https://10.20.199.4:8008
+ca_file = /etc/patroni/ca.pem
+
+[cluster.prod.cluster_node_count]
+warning = 3:
+critical = 2:
+
+[cluster.staging]
+endpoints = http://10.20.200.3:8008
+```
+
+To submit the results to Nagios instead of letting it run one active check per
+service and cluster, the hosts `prod` and `staging` are given the passive
+services `cluster_has_leader` and `cluster_node_count`, and the fleet is
+checked from cron:
+
+```
+check_patroni fleet /etc/check_patroni/fleet.ini \
+  --submit checkresults:/var/spool/nagios/checkresults --submit-batch-size 100
+```
+
+_EOF_
+readme "### daemon"
+helpme daemon
+readme "### watch_events"
+helpme watch_events
+readme "### exporter"
+helpme exporter
 cat << _EOF_ >> $README
 
 _EOF_
@@ -52,6 +52,7 @@ setup(
     entry_points={
         "console_scripts": [
             "check_patroni=check_patroni.cli:main",
+            "check_patroni_client=check_patroni.client:main",
         ],
     },
     zip_safe=False,
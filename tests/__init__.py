@@ -1,21 +1,45 @@
+import gc
 import json
 import logging
 import shutil
+import ssl
+import threading
 from contextlib import contextmanager
 from functools import partial
 from http.server import HTTPServer, SimpleHTTPRequestHandler
 from pathlib import Path
-from typing import Any, Iterator, Mapping, Union
+from typing import Any, Iterator, List, Mapping, Optional, Union
+
+from check_patroni.types import PatroniResource
 
 logger = logging.getLogger(__name__)
 
 
+class RequestHandler(SimpleHTTPRequestHandler):
+    server: "PatroniAPI"
+
+    def do_GET(self) -> None:
+        self.server.requests.append(self.path)
+        super().do_GET()
+
+
 class PatroniAPI(HTTPServer):
-    def __init__(self, directory: Path, *, datadir: Path) -> None:
+    def __init__(
+        self,
+        directory: Path,
+        *,
+        datadir: Path,
+        ssl_context: Optional[ssl.SSLContext] = None,
+    ) -> None:
         self.directory = directory
         self.datadir = datadir
-        handler_cls = partial(SimpleHTTPRequestHandler, directory=str(directory))
+        self.tls = ssl_context is not None
+        # the paths requested, in order
+        self.requests: List[str] = []
+        handler_cls = partial(RequestHandler, directory=str(directory))
         super().__init__(("", 0), handler_cls)
+        if ssl_context is not None:
+            self.socket = ssl_context.wrap_socket(self.socket, server_side=True)
 
     def serve_forever(self, *args: Any) -> None:
         logger.info(
@@ -27,6 +51,9 @@ class PatroniAPI(HTTPServer):
 
     @property
     def endpoint(self) -> str:
+        if self.tls:
+            # the name of the test certificate
+            return f"https://localhost:{self.server_port}"
         return f"http://{self.server_name}:{self.server_port}"
 
     @contextmanager
@@ -49,6 +76,21 @@ class PatroniAPI(HTTPServer):
                 (self.directory / fname).unlink()
 
 
+def barrier(parties: int = 2) -> threading.Barrier:
+    """Get a barrier the threads of a test must reach together to go on.
+
+    It's broken after 5s, failing the test instead of hanging it, when they
+    don't run concurrently.
+    """
+    return threading.Barrier(parties, timeout=5)
+
+
+def live_resources() -> int:
+    """Count the resources still referenced, once garbage collected."""
+    gc.collect()
+    return sum(isinstance(o, PatroniResource) for o in gc.get_objects())
+
+
 def cluster_api_set_replica_running(in_json: Path, target_dir: Path) -> Path:
     # starting from 3.0.4 the state of replicas is streaming or in archive recovery
     # instead of running
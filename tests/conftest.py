@@ -1,4 +1,5 @@
 import logging
+import ssl
 import sys
 from pathlib import Path
 from threading import Thread
@@ -70,6 +71,30 @@ def patroni_api(
     t.join()
 
 
+@pytest.fixture(scope="session")
+def tlsdir() -> Path:
+    return Path(__file__).parent / "tls"
+
+
+@pytest.fixture(scope="session")
+def patroni_api_tls(
+    tmp_path_factory: TempPathFactory, datadir: Path, tlsdir: Path
+) -> Iterator[PatroniAPI]:
+    """The fake HTTP server for the Patroni API, served over https with the
+    self-signed certificate of the tls directory.
+    """
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(tlsdir / "server.crt", tlsdir / "server.key")
+    httpd = PatroniAPI(
+        tmp_path_factory.mktemp("api_tls"), datadir=datadir, ssl_context=context
+    )
+    t = Thread(target=httpd.serve_forever)
+    t.start()
+    yield httpd
+    httpd.shutdown()
+    t.join()
+
+
 @pytest.fixture
 def runner() -> CliRunner:
     """A CliRunner with stdout and stderr not mixed."""
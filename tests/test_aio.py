@@ -0,0 +1,99 @@
+import asyncio
+import subprocess
+import sys
+from typing import Iterator, List
+
+import nagiosplugin
+import pytest
+
+from check_patroni.cluster import ClusterIsInMaintenance, ClusterNodeCount
+from check_patroni.types import (
+    ConnectionInfo,
+    PatroniResource,
+    probe_all,
+    shared_responses,
+)
+
+from . import PatroniAPI, barrier
+
+
+@pytest.fixture
+def cluster_ok(patroni_api: PatroniAPI) -> Iterator[None]:
+    with patroni_api.routes(
+        {
+            "cluster": "cluster_node_count_ok.json",
+            "patroni": "cluster_has_replica_patroni_verion_3.1.0.json",
+        }
+    ):
+        yield None
+
+
+@pytest.mark.usefixtures("cluster_ok")
+def test_aio_rest_api(patroni_api: PatroniAPI) -> None:
+    resource = ClusterNodeCount(ConnectionInfo([patroni_api.endpoint]))
+    cluster = asyncio.run(resource.arest_api("cluster"))
+    assert [m["name"] for m in cluster["members"]] == ["srv1", "srv2", "srv3"]
+
+
+@pytest.mark.usefixtures("cluster_ok")
+def test_aio_probe_all(patroni_api: PatroniAPI) -> None:
+    conn_info = ConnectionInfo([patroni_api.endpoint])
+    node_count, maintenance = asyncio.run(
+        probe_all([ClusterNodeCount(conn_info), ClusterIsInMaintenance(conn_info)])
+    )
+    assert {m.name: m.value for m in node_count} == {
+        "members": 3,
+        "healthy_members": 3,
+        "role_leader": 1,
+        "role_replica": 2,
+        "state_running": 1,
+        "state_streaming": 2,
+    }
+    assert maintenance == [nagiosplugin.Metric("is_in_maintenance", 0)]
+
+
+def test_aio_probe_all_concurrent(monkeypatch: pytest.MonkeyPatch) -> None:
+    # both resources must be probed at the same time to get through
+    together = barrier()
+
+    def probe(self: PatroniResource) -> List[nagiosplugin.Metric]:
+        together.wait()
+        return [nagiosplugin.Metric(type(self).__name__, 1)]
+
+    for cls in (ClusterNodeCount, ClusterIsInMaintenance):
+        monkeypatch.setattr(cls, "probe", probe)
+    resources = [
+        ClusterNodeCount(ConnectionInfo()),
+        ClusterIsInMaintenance(ConnectionInfo()),
+    ]
+    metrics = asyncio.run(probe_all(resources))
+    assert [m.name for m, in metrics] == ["ClusterNodeCount", "ClusterIsInMaintenance"]
+
+
+@pytest.mark.usefixtures("cluster_ok")
+def test_aio_shared_responses(patroni_api: PatroniAPI) -> None:
+    resource = ClusterNodeCount(ConnectionInfo([patroni_api.endpoint]))
+
+    async def fetch() -> None:
+        await asyncio.gather(resource.arest_api("cluster"), resource.aprobe())
+
+    patroni_api.requests.clear()
+    with shared_responses():
+        asyncio.run(fetch())
+        resource.rest_api("cluster")
+    # the queries run by the executor use the snapshot too
+    assert sorted(patroni_api.requests) == ["/cluster", "/patroni"]
+
+
+def test_aio_not_imported() -> None:
+    # the plugin doesn't pay for asyncio, nor for the servers of the services
+    # running other services
+    modules = ["asyncio", "http.server", "socketserver"]
+    code = (
+        "import sys, check_patroni.cli; "
+        f"print([m for m in {modules!r} if m in sys.modules])"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert result.stdout == "[]\n"
@@ -1,10 +1,25 @@
+import socket
+from contextlib import contextmanager
+from typing import Iterator
+
 from click.testing import CliRunner
 
 from check_patroni.cli import main
+from check_patroni.transport import RequestsTransport, get_transport
 
 from . import PatroniAPI
 
 
+@contextmanager
+def blackhole_endpoint() -> Iterator[str]:
+    """A listening socket which never answers: the queries sent to it hang."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        sock.listen()
+        host, port = sock.getsockname()
+        yield f"http://{host}:{port}"
+
+
 def test_api_status_code_200(runner: CliRunner, patroni_api: PatroniAPI) -> None:
     with patroni_api.routes({"patroni": "node_is_pending_restart_ok.json"}):
         result = runner.invoke(
@@ -18,3 +33,99 @@ def test_api_status_code_404(runner: CliRunner, patroni_api: PatroniAPI) -> None
         main, ["-e", patroni_api.endpoint, "node_is_pending_restart"]
     )
     assert result.exit_code == 3
+
+
+def test_api_session_is_pooled(runner: CliRunner, patroni_api: PatroniAPI) -> None:
+    with patroni_api.routes({"patroni": "node_is_pending_restart_ok.json"}):
+        runner.invoke(main, ["-e", patroni_api.endpoint, "node_is_pending_restart"])
+        transport = get_transport("requests")
+        assert isinstance(transport, RequestsTransport)
+        session = transport.session(patroni_api.endpoint, None, None)
+        result = runner.invoke(
+            main, ["-e", patroni_api.endpoint, "node_is_pending_restart"]
+        )
+    assert result.exit_code == 0
+    assert transport.session(patroni_api.endpoint, None, None) is session
+    assert transport.session(patroni_api.endpoint, None, "ca.pem") is not session
+
+
+def test_api_timeout_fallback(runner: CliRunner, patroni_api: PatroniAPI) -> None:
+    with blackhole_endpoint() as blackhole:
+        with patroni_api.routes({"patroni": "node_is_pending_restart_ok.json"}):
+            result = runner.invoke(
+                main,
+                [
+                    "-e",
+                    blackhole,
+                    "-e",
+                    patroni_api.endpoint,
+                    "--timeout",
+                    "2",
+                    "node_is_pending_restart",
+                ],
+            )
+    assert result.exit_code == 0
+
+
+def test_api_fan_out(runner: CliRunner, patroni_api: PatroniAPI) -> None:
+    with blackhole_endpoint() as blackhole:
+        with patroni_api.routes({"patroni": "node_is_pending_restart_ok.json"}):
+            result = runner.invoke(
+                main,
+                [
+                    "-e",
+                    blackhole,
+                    "-e",
+                    patroni_api.endpoint,
+                    "--fan-out",
+                    "2",
+                    "node_is_pending_restart",
+                ],
+            )
+    assert result.exit_code == 0
+
+
+def test_api_fan_out_status_code_404(
+    runner: CliRunner, patroni_api: PatroniAPI
+) -> None:
+    result = runner.invoke(
+        main,
+        [
+            "-e",
+            "http://127.0.0.1:1",
+            "-e",
+            patroni_api.endpoint,
+            "--fan-out",
+            "2",
+            "node_is_pending_restart",
+        ],
+    )
+    assert result.exit_code == 3
+    assert "status code 404" in result.stdout
+
+
+def test_api_hedge_delay(runner: CliRunner, patroni_api: PatroniAPI) -> None:
+    with blackhole_endpoint() as blackhole:
+        with patroni_api.routes({"patroni": "node_is_pending_restart_ok.json"}):
+            result = runner.invoke(
+                main,
+                [
+                    "-e",
+                    blackhole,
+                    "-e",
+                    patroni_api.endpoint,
+                    # without timeout, only the hedged request can answer
+                    "--timeout",
+                    "0",
+                    "--hedge-delay",
+                    "0.05",
+                    "node_is_pending_restart",
+                ],
+            )
+    assert result.exit_code == 0
+
+
+def test_api_hedge_delay_invalid(runner: CliRunner) -> None:
+    result = runner.invoke(main, ["--hedge-delay", "soon", "node_is_alive"])
+    assert result.exit_code == 2
+    assert "must be a number of seconds or auto" in result.stderr
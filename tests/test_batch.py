@@ -0,0 +1,97 @@
+import json
+from typing import Iterator
+
+import pytest
+from click.testing import CliRunner
+
+from check_patroni.cli import main
+
+from . import PatroniAPI
+
+
+@pytest.fixture
+def cluster_ok(patroni_api: PatroniAPI) -> Iterator[None]:
+    with patroni_api.routes(
+        {
+            "cluster": "cluster_node_count_ok.json",
+            "patroni": "cluster_has_replica_patroni_verion_3.1.0.json",
+        }
+    ):
+        yield None
+
+
+@pytest.mark.usefixtures("cluster_ok")
+def test_batch(runner: CliRunner, patroni_api: PatroniAPI) -> None:
+    requests = [
+        f"check_patroni -e {patroni_api.endpoint} cluster_node_count -w 4:",
+        json.dumps(
+            {"id": "leader", "args": ["-e", patroni_api.endpoint, "cluster_has_leader"]}
+        ),
+        "",
+        json.dumps(["-e", patroni_api.endpoint, "node_is_alive", "--nope"]),
+        "{nope",
+    ]
+    result = runner.invoke(main, ["batch"], input="\n".join(requests) + "\n")
+    assert result.exit_code == 0
+    results = [json.loads(line) for line in result.stdout.splitlines()]
+    assert results == [
+        {
+            "exitcode": 1,
+            "output": "CLUSTERNODECOUNT WARNING - members is 3 (outside range 4:) "
+            "| healthy_members=3 members=3;4: role_leader=1 role_replica=2 "
+            "state_running=1 state_streaming=2\n",
+            "perfdata": [
+                "healthy_members=3",
+                "members=3;4:",
+                "role_leader=1",
+                "role_replica=2",
+                "state_running=1",
+                "state_streaming=2",
+            ],
+            "error": "",
+        },
+        {
+            "id": "leader",
+            "exitcode": 0,
+            "output": "CLUSTERHASLEADER OK - The cluster has a running leader. "
+            "| has_leader=1;;@0 is_leader=1 is_standby_leader=0 "
+            "is_standby_leader_in_arc_rec=0;@1:1\n",
+            "perfdata": [
+                "has_leader=1;;@0",
+                "is_leader=1",
+                "is_standby_leader=0",
+                "is_standby_leader_in_arc_rec=0;@1:1",
+            ],
+            "error": "",
+        },
+        {
+            "exitcode": 2,
+            "output": "",
+            "perfdata": [],
+            "error": "Usage: check_patroni node_is_alive [OPTIONS]\n"
+            "Try 'check_patroni node_is_alive --help' for help.\n\n"
+            "Error: No such option: --nope\n",
+        },
+        {
+            "exitcode": 3,
+            "output": "UNKNOWN - invalid request: Expecting property name "
+            "enclosed in double quotes: line 1 column 2 (char 1)\n",
+            "perfdata": [],
+            "error": "",
+        },
+    ]
+
+
+def test_batch_runners(runner: CliRunner, patroni_api: PatroniAPI) -> None:
+    requests = [
+        "exporter --port 0",
+        f"-e {patroni_api.endpoint} batch",
+        "--timeout 1 daemon fleet.ini",
+    ]
+    result = runner.invoke(main, ["batch"], input="\n".join(requests) + "\n")
+    assert result.exit_code == 0
+    assert [json.loads(line)["output"] for line in result.stdout.splitlines()] == [
+        "UNKNOWN - the exporter service can't be run by batch\n",
+        "UNKNOWN - the batch service can't be run by batch\n",
+        "UNKNOWN - the daemon service can't be run by batch\n",
+    ]
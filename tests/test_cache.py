@@ -0,0 +1,113 @@
+import threading
+from pathlib import Path
+from typing import Any, Callable, List, Tuple
+
+import nagiosplugin
+from click.testing import CliRunner
+
+from check_patroni.cache import ResponseCache, SingleFlight
+from check_patroni.cli import main
+
+from . import PatroniAPI
+
+ENDPOINTS = ["http://node1", "http://node2"]
+
+
+def test_cache_store_load(tmp_path: Path) -> None:
+    cache = ResponseCache(str(tmp_path), 10)
+    endpoints = ["http://node1", "http://node2"]
+    assert cache.load(endpoints, "cluster") is None
+
+    cache.store(endpoints, "cluster", {"members": []})
+    cached = cache.get(endpoints[::-1], "cluster")
+    assert cached is not None
+    assert cached.data == {"members": []}
+    assert cache.get(endpoints, "config") is None
+    # the temporary file was renamed
+    assert [p.name for p in (tmp_path / "responses").iterdir()] == [
+        Path(cache.path(endpoints, "cluster")).name
+    ]
+
+    cache.max_age = -1
+    assert cache.get(endpoints, "cluster") is None
+    assert cache.load(endpoints, "cluster") is not None
+
+
+def test_cache_shared_between_checks(
+    runner: CliRunner, patroni_api: PatroniAPI, tmp_path: Path
+) -> None:
+    args = ["-e", patroni_api.endpoint, "--state-dir", str(tmp_path)]
+    with patroni_api.routes({"cluster": "cluster_has_leader_ok.json"}):
+        result = runner.invoke(
+            main, args + ["--cache-max-age", "60", "cluster_has_leader"]
+        )
+    assert result.exit_code == 0
+
+    # the API doesn't answer /cluster anymore, the cached response is used
+    result = runner.invoke(main, args + ["--cache-max-age", "60", "cluster_has_leader"])
+    assert result.exit_code == 0
+
+    result = runner.invoke(main, args + ["cluster_has_leader"])
+    assert result.exit_code == 3
+
+
+def slow_flight(
+    flight: SingleFlight, fetch: Callable[[], Any]
+) -> Tuple[threading.Thread, threading.Event, List[Any]]:
+    """Run a query in a thread, it holds the lock until the event is set."""
+    started = threading.Event()
+    release = threading.Event()
+    results: List[Any] = []
+
+    def slow() -> Any:
+        started.set()
+        release.wait(5)
+        return fetch()
+
+    def run() -> None:
+        try:
+            results.append(flight.run(ENDPOINTS, "cluster", slow))
+        except Exception as e:
+            results.append(e)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    assert started.wait(5)
+    return thread, release, results
+
+
+def unexpected_fetch() -> Any:
+    raise AssertionError("the query should have been coalesced")
+
+
+def test_single_flight_shared_response(tmp_path: Path) -> None:
+    flight = SingleFlight(str(tmp_path), 5)
+    thread, release, results = slow_flight(flight, lambda: {"members": []})
+    threading.Timer(0.1, release.set).start()
+    assert flight.run(ENDPOINTS, "cluster", unexpected_fetch) == {"members": []}
+    thread.join()
+    assert results == [{"members": []}]
+
+
+def test_single_flight_leader_failed(tmp_path: Path) -> None:
+    flight = SingleFlight(str(tmp_path), 5)
+
+    def failed() -> Any:
+        raise nagiosplugin.CheckError("Connection failed for all provided endpoints")
+
+    thread, release, results = slow_flight(flight, failed)
+    threading.Timer(0.1, release.set).start()
+    assert flight.run(ENDPOINTS, "cluster", lambda: "own") == "own"
+    thread.join()
+    assert isinstance(results[0], nagiosplugin.CheckError)
+
+
+def test_single_flight_wait_bounded(tmp_path: Path) -> None:
+    flight = SingleFlight(str(tmp_path), 5)
+    thread, release, results = slow_flight(flight, lambda: "leader")
+    try:
+        assert flight.run(ENDPOINTS, "cluster", lambda: "own", wait=0.05) == "own"
+    finally:
+        release.set()
+        thread.join()
+    assert results == ["leader"]
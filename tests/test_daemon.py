@@ -0,0 +1,140 @@
+import threading
+from pathlib import Path
+from typing import Iterator
+
+import attr
+import pytest
+
+from check_patroni import client
+from check_patroni.cli import cluster_parameters, collect_service
+from check_patroni.daemon import ClusterPoller, Daemon, DaemonServer
+
+from . import PatroniAPI, live_resources
+
+
+@pytest.fixture
+def cluster_ok(patroni_api: PatroniAPI) -> Iterator[None]:
+    with patroni_api.routes(
+        {
+            "cluster": "cluster_node_count_ok.json",
+            "config": "cluster_config_has_changed.json",
+            "patroni": "cluster_has_replica_patroni_verion_3.1.0.json",
+        }
+    ):
+        yield None
+
+
+@pytest.fixture
+def daemon(patroni_api: PatroniAPI) -> Daemon:
+    defaults = {"endpoints": [patroni_api.endpoint]}
+    poller = ClusterPoller(
+        "prod", cluster_parameters("prod", defaults), interval=10, jitter=0.1
+    )
+    return Daemon(
+        {"prod": poller},
+        lambda name, args: collect_service(name, args, defaults),
+        max_stale=60,
+    )
+
+
+@pytest.mark.usefixtures("cluster_ok")
+def test_daemon_answer(daemon: Daemon, patroni_api: PatroniAPI) -> None:
+    daemon.pollers["prod"].poll()
+    patroni_api.requests.clear()
+    result = daemon.answer(
+        {"cluster": "prod", "args": ["cluster_has_replica", "-w", "3:"]}
+    )
+    assert result == {
+        "exitcode": 1,
+        "output": "CLUSTERHASREPLICA WARNING - healthy_replica is 2 (outside range 3:) "
+        "| healthy_replica=2;3: srv2_lag=0 srv2_sync=0 srv2_timeline=51 srv3_lag=0 "
+        "srv3_sync=0 srv3_timeline=51 sync_replica=0 unhealthy_replica=0\n",
+        "stale": {},
+    }
+    # the responses kept were used
+    assert patroni_api.requests == []
+
+
+@pytest.mark.usefixtures("cluster_ok")
+def test_daemon_stale(daemon: Daemon, patroni_api: PatroniAPI) -> None:
+    poller = daemon.pollers["prod"]
+    poller.poll()
+    response = poller.responses["cluster"]
+    poller.responses["cluster"] = attr.evolve(
+        response, fetched_at=response.fetched_at - 30
+    )
+    patroni_api.requests.clear()
+    result = daemon.answer({"cluster": "prod", "args": ["cluster_is_in_maintenance"]})
+    assert result["exitcode"] == 0
+    assert result["stale"] == {"cluster": 30.0}
+    assert result["output"].endswith("\nStale response to cluster: 30.0s old\n")
+    assert patroni_api.requests == []
+    # the cluster is polled again
+    assert poller._wakeup.is_set()
+
+    # too old to be used
+    poller.responses["cluster"] = attr.evolve(
+        response, fetched_at=response.fetched_at - 90
+    )
+    result = daemon.answer({"cluster": "prod", "args": ["cluster_is_in_maintenance"]})
+    assert result["exitcode"] == 0
+    assert result["stale"] == {}
+    assert patroni_api.requests == ["/cluster"]
+
+
+@pytest.mark.usefixtures("cluster_ok")
+def test_daemon_requests(daemon: Daemon) -> None:
+    daemon.pollers["prod"].poll()
+    request = {"cluster": "prod", "args": ["cluster_has_replica"]}
+    daemon.answer(request)
+    count = live_resources()
+    for _ in range(5):
+        assert daemon.answer(request)["exitcode"] == 0
+    # the resources of the previous requests aren't kept
+    assert live_resources() == count
+
+
+def test_daemon_invalid(daemon: Daemon) -> None:
+    assert daemon.answer({"cluster": "nope", "args": ["cluster_has_leader"]}) == {
+        "exitcode": 3,
+        "output": "UNKNOWN - unknown cluster 'nope'\n",
+        "stale": {},
+    }
+    assert daemon.answer({"cluster": "prod", "args": ["multi"]}) == {
+        "exitcode": 3,
+        "output": "UNKNOWN - unknown service 'multi' for cluster prod\n",
+        "stale": {},
+    }
+
+
+@pytest.fixture
+def server(daemon: Daemon, tmp_path: Path) -> Iterator[str]:
+    path = str(tmp_path / "daemon.sock")
+    server = DaemonServer(path, daemon)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    daemon.start()
+    yield path
+    daemon.stop()
+    server.shutdown()
+    server.server_close()
+    assert not Path(path).exists()
+
+
+@pytest.mark.usefixtures("cluster_ok")
+def test_daemon_client(
+    server: str, tmp_path: Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+    with pytest.raises(SystemExit) as excinfo:
+        client.main(["--socket", server, "prod", "cluster_has_leader"])
+    assert excinfo.value.code == 0
+    assert capsys.readouterr().out == (
+        "CLUSTERHASLEADER OK - The cluster has a running leader. | has_leader=1;;@0 "
+        "is_leader=1 is_standby_leader=0 is_standby_leader_in_arc_rec=0;@1:1\n"
+    )
+
+    with pytest.raises(SystemExit) as excinfo:
+        client.main(["--socket", str(tmp_path / "nope.sock"), "prod", "node_is_alive"])
+    assert excinfo.value.code == 3
+    assert capsys.readouterr().out.startswith(
+        f"UNKNOWN - cannot get the result from the daemon at {tmp_path}/nope.sock: "
+    )
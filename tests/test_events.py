@@ -0,0 +1,71 @@
+import json
+import socket
+import threading
+import time
+from pathlib import Path
+
+from check_patroni.events import ClusterWatcher, EventServer
+from check_patroni.types import ConnectionInfo
+
+from . import PatroniAPI
+
+
+def test_watcher(patroni_api: PatroniAPI, datadir: Path, tmp_path: Path) -> None:
+    switchover = datadir / "cluster_has_scheduled_action_ko_switchover.json"
+    stable = tmp_path / "cluster.json"
+    cluster = json.loads(switchover.read_text())
+    del cluster["scheduled_switchover"]
+    stable.write_text(json.dumps(cluster))
+    watcher = ClusterWatcher(ConnectionInfo([patroni_api.endpoint]), 2, 0.5, 4)
+
+    with patroni_api.routes({"cluster": stable}):
+        (event,) = watcher.poll()
+        assert event["event"] == "topology"
+        assert event["leader"] == "p2"
+        assert sorted(event["members"]) == ["p1", "p2"]
+        assert watcher.interval == 0.5
+
+        # the interval grows while the cluster is stable
+        assert watcher.poll() == []
+        assert watcher.poll() == []
+        assert watcher.interval == 2
+
+    with patroni_api.routes({"cluster": switchover}):
+        events = watcher.poll()
+    assert [{k: v for k, v in e.items() if k != "time"} for e in events] == [
+        {
+            "event": "scheduled_switchover_changed",
+            "old": None,
+            "new": {"at": "2023-10-08T11:30:00+00:00", "from": "p1", "to": "p2"},
+        }
+    ]
+    assert watcher.interval == 0.5
+
+    (event,) = watcher.poll()
+    assert event["event"] == "api_unreachable"
+    assert watcher.poll() == []
+    with patroni_api.routes({"cluster": stable}):
+        events = watcher.poll()
+    assert [e["event"] for e in events] == [
+        "api_reachable",
+        "scheduled_switchover_changed",
+    ]
+
+
+def test_event_server(tmp_path: Path) -> None:
+    path = str(tmp_path / "events.sock")
+    server = EventServer(path)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(path)
+            deadline = time.monotonic() + 5
+            while not server.subscribers and time.monotonic() < deadline:
+                time.sleep(0.01)
+            server.publish({"event": "api_reachable"})
+            with sock.makefile("rb") as f:
+                assert json.loads(f.readline()) == {"event": "api_reachable"}
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert not Path(path).exists()
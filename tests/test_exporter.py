@@ -0,0 +1,107 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+
+from check_patroni.exporter import CONTENT_TYPE, Exporter, ExporterServer
+from check_patroni.types import ConnectionInfo
+
+from . import PatroniAPI, live_resources
+
+
+@pytest.fixture
+def cluster_ok(patroni_api: PatroniAPI) -> Iterator[None]:
+    with patroni_api.routes(
+        {
+            "cluster": "cluster_node_count_ok.json",
+            "patroni": "cluster_has_replica_patroni_verion_3.1.0.json",
+        }
+    ):
+        yield None
+
+
+@pytest.fixture
+def exporter(patroni_api: PatroniAPI) -> Exporter:
+    return Exporter(ConnectionInfo([patroni_api.endpoint]), 2, 10)
+
+
+@pytest.mark.usefixtures("cluster_ok")
+def test_exporter_metrics(exporter: Exporter, patroni_api: PatroniAPI) -> None:
+    patroni_api.requests.clear()
+    metrics = exporter.metrics()
+    lines = metrics.splitlines()
+    for line in [
+        "# TYPE patroni_healthy_members gauge",
+        'patroni_healthy_members{service="cluster_node_count"} 3',
+        'patroni_members_by_role{service="cluster_node_count",role="replica"} 2',
+        'patroni_members_by_state{service="cluster_node_count",state="streaming"} 2',
+        'patroni_replica_lag{service="cluster_has_replica",member="srv2"} 0',
+        'patroni_replica_timeline{service="cluster_has_replica",member="srv3"} 51',
+        'patroni_is_in_maintenance{service="cluster_is_in_maintenance"} 0',
+        'patroni_is_primary{service="node_is_primary",member="srv1"} 1',
+        'patroni_is_replica{service="node_is_replica",member="srv1"} 0',
+        'patroni_is_replica{service="node_is_replica",member="srv2"} 1',
+        'patroni_probe_success{service="cluster_has_leader"} 1',
+    ]:
+        assert line in lines
+    # one query per service of the API
+    assert sorted(patroni_api.requests) == ["/cluster", "/patroni"]
+
+    # the metrics are kept
+    assert exporter.metrics() == metrics
+    assert len(patroni_api.requests) == 2
+
+
+def test_exporter_member_names(
+    exporter: Exporter, patroni_api: PatroniAPI, datadir: Path, tmp_path: Path
+) -> None:
+    cluster = json.loads((datadir / "cluster_node_count_ok.json").read_text())
+    for member in cluster["members"]:
+        member["name"] = member["name"].replace("srv", "pg node-")
+    path = tmp_path / "cluster.json"
+    path.write_text(json.dumps(cluster))
+    with patroni_api.routes(
+        {"cluster": path, "patroni": "cluster_has_replica_patroni_verion_3.1.0.json"}
+    ):
+        lines = exporter.metrics().splitlines()
+    assert (
+        'patroni_replica_lag{service="cluster_has_replica",member="pg node-2"} 0'
+        in lines
+    )
+
+
+@pytest.mark.usefixtures("cluster_ok")
+def test_exporter_scrapes(exporter: Exporter) -> None:
+    exporter.collect()
+    count = live_resources()
+    for _ in range(5):
+        exporter.collect()
+    # the resources of the previous scrapes aren't kept
+    assert live_resources() == count
+
+
+def test_exporter_failure(exporter: Exporter) -> None:
+    lines = exporter.metrics().splitlines()
+    assert 'patroni_probe_success{service="cluster_node_count"} 0' in lines
+    assert not [line for line in lines if line.startswith("patroni_members")]
+
+
+@pytest.mark.usefixtures("cluster_ok")
+def test_exporter_server(exporter: Exporter) -> None:
+    server = ExporterServer(("127.0.0.1", 0), exporter)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+    try:
+        with urllib.request.urlopen(f"{url}/metrics") as r:
+            assert r.headers["Content-Type"] == CONTENT_TYPE
+            assert b"patroni_has_leader" in r.read()
+        with pytest.raises(urllib.error.HTTPError) as excinfo:
+            urllib.request.urlopen(f"{url}/")
+        assert excinfo.value.code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
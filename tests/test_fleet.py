@@ -0,0 +1,126 @@
+import time
+from pathlib import Path
+from typing import Iterator, List
+
+import nagiosplugin
+import pytest
+from click.testing import CliRunner
+
+from check_patroni.cli import main
+from check_patroni.evaluate import Evaluation
+from check_patroni.fleet import ClusterChecks, run_fleet
+from check_patroni.types import PatroniCheck
+
+from . import PatroniAPI
+
+
+@pytest.fixture
+def cluster_ok(patroni_api: PatroniAPI) -> Iterator[None]:
+    with patroni_api.routes(
+        {
+            "cluster": "cluster_node_count_ok.json",
+            "patroni": "cluster_has_replica_patroni_verion_3.1.0.json",
+        }
+    ):
+        yield None
+
+
+@pytest.mark.usefixtures("cluster_ok")
+def test_fleet(runner: CliRunner, patroni_api: PatroniAPI, tmp_path: Path) -> None:
+    fleet_file = tmp_path / "fleet.ini"
+    fleet_file.write_text(f"""\
+[options]
+endpoints = {patroni_api.endpoint}
+
+[options.cluster_has_leader]
+
+[cluster.prod]
+timeout = 5
+
+[cluster.prod.cluster_node_count]
+warning = 4:
+
+[cluster.down]
+endpoints = http://127.0.0.1:1
+""")
+    result = runner.invoke(main, ["fleet", str(fleet_file)])
+    assert result.stdout == (
+        "FLEET UNKNOWN - 1 warning, 1 unknown, 1 ok\n"
+        "prod cluster_has_leader: CLUSTERHASLEADER OK - The cluster has a running leader. "
+        "| has_leader=1;;@0 is_leader=1 is_standby_leader=0 is_standby_leader_in_arc_rec=0;@1:1\n"
+        "prod cluster_node_count: CLUSTERNODECOUNT WARNING - members is 3 (outside range 4:) "
+        "| healthy_members=3 members=3;4: role_leader=1 role_replica=2 state_running=1 state_streaming=2\n"
+        "down cluster_has_leader: CLUSTERHASLEADER UNKNOWN - Connection failed for all provided endpoints\n"
+    )
+    assert result.exit_code == 3
+
+
+def test_fleet_unknown_service(runner: CliRunner, tmp_path: Path) -> None:
+    fleet_file = tmp_path / "fleet.ini"
+    fleet_file.write_text("[cluster.prod]\n[cluster.prod.nope]\n")
+    result = runner.invoke(main, ["fleet", str(fleet_file)])
+    assert result.exit_code == 3
+    assert "unknown service 'nope' for cluster prod" in result.stdout
+
+
+class SlowResource(nagiosplugin.Resource):
+    def __init__(self, delay: float) -> None:
+        self.delay = delay
+
+    def probe(self) -> List[nagiosplugin.Metric]:
+        time.sleep(self.delay)
+        return [nagiosplugin.Metric("delay", self.delay, context="delay")]
+
+
+def cluster(name: str, timeout: int, delay: float) -> ClusterChecks:
+    check = PatroniCheck(SlowResource(delay), nagiosplugin.ScalarContext("delay"))
+    return ClusterChecks(name, timeout, [("slow", check)])
+
+
+def test_fleet_timeout() -> None:
+    start = time.monotonic()
+    evaluations = run_fleet(
+        [cluster("hung", 1, 10), cluster("fast", 1, 0), cluster("next", 1, 0)], 2
+    )
+    # the hung cluster doesn't hold the others up
+    assert time.monotonic() - start < 2
+    assert [(e.cluster, str(e.state), e.summary) for e in evaluations] == [
+        ("hung", "unknown", "Timeout: check execution aborted after 1s"),
+        ("fast", "ok", "delay is 0"),
+        ("next", "ok", "delay is 0"),
+    ]
+
+
+class BrokenCluster(ClusterChecks):
+    def run(self) -> List[Evaluation]:
+        raise self.checks[0][1].resources[0].error
+
+
+class BrokenResource(SlowResource):
+    def __init__(self, error: BaseException) -> None:
+        super().__init__(0)
+        self.error = error
+
+
+def broken_cluster(error: BaseException) -> ClusterChecks:
+    check = PatroniCheck(BrokenResource(error), nagiosplugin.ScalarContext("delay"))
+    return BrokenCluster("broken", 1, [("slow", check)])
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_fleet_failure() -> None:
+    evaluations = run_fleet(
+        [broken_cluster(RuntimeError("no route")), cluster("next", 1, 0)], 1
+    )
+    # the worker goes on with the next cluster
+    assert [(e.cluster, str(e.state), e.summary) for e in evaluations] == [
+        ("broken", "unknown", "RuntimeError: no route"),
+        ("next", "ok", "delay is 0"),
+    ]
+
+    # the clusters are not waited for once the workers are gone
+    evaluations = run_fleet([broken_cluster(SystemExit()), cluster("next", 1, 0)], 1)
+    assert [(e.cluster, str(e.state), e.summary) for e in evaluations] == [
+        ("broken", "unknown", "the check of the cluster was interrupted"),
+        ("next", "unknown", "the check of the cluster was not started"),
+    ]
@@ -0,0 +1,65 @@
+from click.testing import CliRunner
+
+from check_patroni.cli import main
+
+from . import PatroniAPI
+
+
+def test_multi(runner: CliRunner, patroni_api: PatroniAPI) -> None:
+    patroni_api.requests.clear()
+    with patroni_api.routes(
+        {
+            "cluster": "cluster_node_count_ok.json",
+            "patroni": "cluster_has_replica_patroni_verion_3.1.0.json",
+        }
+    ):
+        result = runner.invoke(
+            main,
+            [
+                "-e",
+                patroni_api.endpoint,
+                "multi",
+                "cluster_node_count -w 4: -c 2:",
+                "cluster_has_leader",
+                "cluster_has_replica",
+            ],
+        )
+    assert result.stdout == (
+        "MULTI WARNING - 1 warning, 2 ok | "
+        "cluster_node_count::healthy_members=3 cluster_node_count::members=3;4:;2: "
+        "cluster_node_count::role_leader=1 cluster_node_count::role_replica=2 "
+        "cluster_node_count::state_running=1 cluster_node_count::state_streaming=2 "
+        "cluster_has_leader::has_leader=1;;@0 "
+        "cluster_has_leader::is_leader=1 cluster_has_leader::is_standby_leader=0 "
+        "cluster_has_leader::is_standby_leader_in_arc_rec=0;@1:1 "
+        "cluster_has_replica::healthy_replica=2 "
+        "cluster_has_replica::srv2_lag=0 cluster_has_replica::srv2_sync=0 "
+        "cluster_has_replica::srv2_timeline=51 cluster_has_replica::srv3_lag=0 "
+        "cluster_has_replica::srv3_sync=0 cluster_has_replica::srv3_timeline=51 "
+        "cluster_has_replica::sync_replica=0 cluster_has_replica::unhealthy_replica=0\n"
+        "CLUSTERNODECOUNT WARNING - members is 3 (outside range 4:)\n"
+        "CLUSTERHASLEADER OK - The cluster has a running leader.\n"
+        "CLUSTERHASREPLICA OK - healthy_replica is 2\n"
+    )
+    assert result.exit_code == 1
+    # each service of the API is queried once
+    assert sorted(patroni_api.requests) == ["/cluster", "/patroni"]
+
+
+def test_multi_unknown(runner: CliRunner, patroni_api: PatroniAPI) -> None:
+    result = runner.invoke(
+        main,
+        ["-e", patroni_api.endpoint, "multi", "cluster_has_leader", "node_is_alive"],
+    )
+    assert result.stdout == (
+        "MULTI UNKNOWN - 1 critical, 1 unknown | node_is_alive::is_alive=0;;@0\n"
+        f"CLUSTERHASLEADER UNKNOWN - check_patroni.types.APIError: Failed to connect to {patroni_api.endpoint}/cluster status code 404\n"
+        "NODEISALIVE CRITICAL - This node is not alive (patroni is not running).\n"
+    )
+    assert result.exit_code == 3
+
+
+def test_multi_invalid_service(runner: CliRunner, patroni_api: PatroniAPI) -> None:
+    result = runner.invoke(main, ["-e", patroni_api.endpoint, "multi", "nope -w 1"])
+    assert result.exit_code == 3
+    assert "unknown service 'nope -w 1'" in result.stdout
@@ -27,3 +27,18 @@ def test_node_is_pending_restart_ko(runner: CliRunner, patroni_api: PatroniAPI)
         result.stdout
         == "NODEISPENDINGRESTART CRITICAL - This node has the pending restart flag. | is_pending_restart=1;;0\n"
     )
+
+
+def test_node_is_pending_restart_member(
+    runner: CliRunner, patroni_api: PatroniAPI
+) -> None:
+    args = ["-e", patroni_api.endpoint, "node_is_pending_restart", "--member"]
+    with patroni_api.routes({"cluster": "cluster_node_is_pending_restart.json"}):
+        result = runner.invoke(main, args + ["srv1"])
+        assert result.exit_code == 0
+        result = runner.invoke(main, args + ["srv2"])
+    assert result.exit_code == 2
+    assert (
+        result.stdout
+        == "NODEISPENDINGRESTART CRITICAL - This node has the pending restart flag. | is_pending_restart=1;;0\n"
+    )
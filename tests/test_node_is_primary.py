@@ -22,3 +22,41 @@ def test_node_is_primary_ko(runner: CliRunner, patroni_api: PatroniAPI) -> None:
         result.stdout
         == "NODEISPRIMARY CRITICAL - This node is not the primary with the leader lock. | is_primary=0;;@0\n"
     )
+
+
+def test_node_is_primary_member_ok(runner: CliRunner, patroni_api: PatroniAPI) -> None:
+    with patroni_api.routes({"cluster": "cluster_node_count_ok.json"}):
+        result = runner.invoke(
+            main, ["-e", patroni_api.endpoint, "node_is_primary", "--member", "srv1"]
+        )
+    assert result.exit_code == 0
+    assert (
+        result.stdout
+        == "NODEISPRIMARY OK - This node is the primary with the leader lock. | is_primary=1;;@0\n"
+    )
+
+
+def test_node_is_primary_member_ko(runner: CliRunner, patroni_api: PatroniAPI) -> None:
+    with patroni_api.routes({"cluster": "cluster_node_count_ok.json"}):
+        result = runner.invoke(
+            main, ["-e", patroni_api.endpoint, "node_is_primary", "--member", "srv2"]
+        )
+    assert result.exit_code == 2
+    assert (
+        result.stdout
+        == "NODEISPRIMARY CRITICAL - This node is not the primary with the leader lock. | is_primary=0;;@0\n"
+    )
+
+
+def test_node_is_primary_member_not_found(
+    runner: CliRunner, patroni_api: PatroniAPI
+) -> None:
+    with patroni_api.routes({"cluster": "cluster_node_count_ok.json"}):
+        result = runner.invoke(
+            main, ["-e", patroni_api.endpoint, "node_is_primary", "--member", "srv4"]
+        )
+    assert result.exit_code == 3
+    assert (
+        result.stdout
+        == "NODEISPRIMARY UNKNOWN - Member srv4 not found in the cluster\n"
+    )
@@ -285,3 +285,50 @@ def test_node_is_replica_quorum_ko(runner: CliRunner, patroni_api: PatroniAPI) -
         == "NODEISREPLICA CRITICAL - This node is not a running synchronous replica of kind 'quorum' with no noloadbalance tag. | is_replica=0;;@0\n"
     )
     assert result.exit_code == 2
+
+
+@pytest.fixture
+def node_is_replica_member(patroni_api: PatroniAPI) -> Iterator[None]:
+    with patroni_api.routes({"cluster": "cluster_node_count_ok_sync.json"}):
+        yield None
+
+
+@pytest.mark.usefixtures("node_is_replica_member")
+def test_node_is_replica_member_ok(runner: CliRunner, patroni_api: PatroniAPI) -> None:
+    result = runner.invoke(
+        main,
+        ["-e", patroni_api.endpoint, "node_is_replica", "--member", "srv3"]
+        + ["--is-async", "--max-lag", "1MB"],
+    )
+    assert (
+        result.stdout
+        == "NODEISREPLICA OK - This node is a running asynchronous replica with no noloadbalance tag and the lag is under 1MB. | is_replica=1;;@0\n"
+    )
+    assert result.exit_code == 0
+
+
+@pytest.mark.usefixtures("node_is_replica_member")
+def test_node_is_replica_member_sync(
+    runner: CliRunner, patroni_api: PatroniAPI
+) -> None:
+    args = ["-e", patroni_api.endpoint, "node_is_replica", "--is-sync", "--member"]
+    result = runner.invoke(main, args + ["srv2"])
+    assert result.exit_code == 0
+
+    for member in ("srv1", "srv3"):
+        result = runner.invoke(main, args + [member])
+        assert (
+            result.stdout
+            == "NODEISREPLICA CRITICAL - This node is not a running synchronous replica of kind 'any' with no noloadbalance tag. | is_replica=0;;@0\n"
+        )
+        assert result.exit_code == 2
+
+
+def test_node_is_replica_member_lag(runner: CliRunner, patroni_api: PatroniAPI) -> None:
+    with patroni_api.routes({"cluster": "cluster_has_replica_ok_lag.json"}):
+        result = runner.invoke(
+            main,
+            ["-e", patroni_api.endpoint, "node_is_replica", "--member", "srv2"]
+            + ["--max-lag", "100"],
+        )
+    assert result.exit_code == 2
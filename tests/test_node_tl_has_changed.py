@@ -171,3 +171,17 @@ def test_node_tl_has_changed_params(
         result.stdout
         == "NODETLHASCHANGED UNKNOWN: click.exceptions.UsageError: Either --timeline or --state-file should be provided for this service\n"
     )
+
+
+def test_node_tl_has_changed_member(runner: CliRunner, patroni_api: PatroniAPI) -> None:
+    with patroni_api.routes({"cluster": "cluster_node_count_ok.json"}):
+        result = runner.invoke(
+            main,
+            ["-e", patroni_api.endpoint, "node_tl_has_changed", "--timeline", "50"]
+            + ["--member", "srv2"],
+        )
+    assert result.exit_code == 2
+    assert (
+        result.stdout
+        == "NODETLHASCHANGED CRITICAL - The expected timeline was 50 got 51. | is_timeline_changed=1;;@1:1 timeline=51\n"
+    )
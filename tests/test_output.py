@@ -0,0 +1,110 @@
+import json
+
+from click.testing import CliRunner
+
+from check_patroni.cli import main
+
+from . import PatroniAPI
+
+
+def test_output_json(runner: CliRunner, patroni_api: PatroniAPI) -> None:
+    with patroni_api.routes(
+        {
+            "cluster": "cluster_node_count_ok.json",
+            "patroni": "cluster_has_replica_patroni_verion_3.1.0.json",
+        }
+    ):
+        result = runner.invoke(
+            main,
+            [
+                "-e",
+                patroni_api.endpoint,
+                "--output",
+                "json",
+                "cluster_node_count",
+                "-w",
+                "4:",
+                "-c",
+                "2:",
+            ],
+        )
+    assert result.exit_code == 1
+    output = json.loads(result.stdout)
+    assert output["timing"]["duration"] >= 0
+    assert output["timing"]["started_at"] > 0
+    del output["timing"]
+    members = {m["name"]: m for m in output.pop("metrics")}
+    assert output == {
+        "service": "cluster_node_count",
+        "name": "CLUSTERNODECOUNT",
+        "state": "warning",
+        "exitcode": 1,
+        "summary": "members is 3 (outside range 4:)",
+        "logs": [],
+    }
+    assert sorted(members) == [
+        "healthy_members",
+        "members",
+        "role_leader",
+        "role_replica",
+        "state_running",
+        "state_streaming",
+    ]
+    assert members["members"] == {
+        "name": "members",
+        "value": 3,
+        "uom": None,
+        "min": None,
+        "max": None,
+        "context": "members",
+        "warning": "4:",
+        "critical": "2:",
+        "state": "warning",
+        "hint": "outside range 4:",
+    }
+    assert members["role_replica"]["context"] == "member_roles"
+    assert members["role_replica"]["warning"] is None
+
+
+def test_output_json_unknown(runner: CliRunner, patroni_api: PatroniAPI) -> None:
+    result = runner.invoke(
+        main, ["-e", patroni_api.endpoint, "--output", "json", "cluster_has_leader"]
+    )
+    assert result.exit_code == 3
+    output = json.loads(result.stdout)
+    assert output["state"] == "unknown"
+    assert output["summary"] == (
+        "check_patroni.types.APIError: Failed to connect to "
+        f"{patroni_api.endpoint}/cluster status code 404"
+    )
+    assert output["metrics"] == []
+
+
+def test_output_json_multi(runner: CliRunner, patroni_api: PatroniAPI) -> None:
+    with patroni_api.routes(
+        {
+            "cluster": "cluster_node_count_ok.json",
+            "patroni": "cluster_has_replica_patroni_verion_3.1.0.json",
+        }
+    ):
+        result = runner.invoke(
+            main,
+            [
+                "-e",
+                patroni_api.endpoint,
+                "--output",
+                "json",
+                "multi",
+                "cluster_node_count -w 4: -c 2:",
+                "cluster_has_leader",
+            ],
+        )
+    assert result.exit_code == 1
+    output = json.loads(result.stdout)
+    assert output["name"] == "MULTI"
+    assert output["state"] == "warning"
+    assert output["summary"] == "1 warning, 1 ok"
+    assert [(s["service"], s["state"]) for s in output["services"]] == [
+        ("cluster_node_count", "warning"),
+        ("cluster_has_leader", "ok"),
+    ]
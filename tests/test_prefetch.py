@@ -0,0 +1,117 @@
+import threading
+import time
+from typing import Any, Iterator, List, Optional
+
+import nagiosplugin
+import pytest
+from click.testing import CliRunner
+
+from check_patroni.cli import main
+from check_patroni.cluster import ClusterHasReplica
+from check_patroni.types import (
+    ConnectionInfo,
+    Deadline,
+    PatroniCheck,
+    shared_responses,
+)
+
+from . import PatroniAPI, barrier
+
+
+@pytest.fixture
+def cluster_ok(patroni_api: PatroniAPI) -> Iterator[None]:
+    with patroni_api.routes(
+        {
+            "cluster": "cluster_node_count_ok.json",
+            "patroni": "cluster_has_replica_patroni_verion_3.1.0.json",
+        }
+    ):
+        yield None
+
+
+@pytest.mark.usefixtures("cluster_ok")
+def test_prefetch_once(runner: CliRunner, patroni_api: PatroniAPI) -> None:
+    patroni_api.requests.clear()
+    result = runner.invoke(main, ["-e", patroni_api.endpoint, "cluster_has_replica"])
+    assert result.exit_code == 0
+    assert sorted(patroni_api.requests) == ["/cluster", "/patroni"]
+
+
+def test_prefetch_concurrent(monkeypatch: pytest.MonkeyPatch) -> None:
+    fetched: List[str] = []
+    lock = threading.Lock()
+    # both services must be fetched at the same time to get through
+    together = barrier()
+
+    def together_rest_api(self: Any, service: str) -> Any:
+        together.wait()
+        with lock:
+            fetched.append(service)
+        if service == "patroni":
+            return {"patroni": {"version": "3.1.0"}}
+        return {"members": []}
+
+    monkeypatch.setattr(ClusterHasReplica, "_rest_api", together_rest_api)
+    resource = ClusterHasReplica(ConnectionInfo(), None, "any")
+    check = PatroniCheck(resource, nagiosplugin.ScalarContext("healthy_replica"))
+    for name in ("unhealthy_replica", "sync_replica"):
+        check.add(nagiosplugin.ScalarContext(name))
+
+    with shared_responses():
+        check()
+        assert resource.has_detailed_states()
+    # the services were fetched together, once
+    assert check.state == nagiosplugin.Ok
+    assert sorted(fetched) == ["cluster", "patroni"]
+
+
+class SlowResource(nagiosplugin.Resource):
+    def __init__(
+        self,
+        name: str,
+        delay: float,
+        deadline: Any = None,
+        barrier: Optional[threading.Barrier] = None,
+    ) -> None:
+        self._name = name
+        self.delay = delay
+        self.deadline = deadline
+        self.barrier = barrier
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    def probe(self) -> List[nagiosplugin.Metric]:
+        if self.barrier is not None:
+            self.barrier.wait()
+        time.sleep(self.delay)
+        return [nagiosplugin.Metric(self._name, self.delay, context="delay")]
+
+
+def test_probe_concurrent() -> None:
+    # both resources must be probed at the same time to get through
+    together = barrier()
+    check = PatroniCheck(
+        SlowResource("slow", 0.1, barrier=together),
+        SlowResource("fast", 0, barrier=together),
+        nagiosplugin.ScalarContext("delay"),
+    )
+    check()
+    assert check.state == nagiosplugin.Ok
+    # the results are in the order of the resources
+    assert [r.metric.name for r in check.results] == ["slow", "fast"]
+    assert check.name == "slow"
+
+
+def test_probe_deadline() -> None:
+    check = PatroniCheck(
+        SlowResource("slow", 1, Deadline(0.2)),
+        SlowResource("fast", 0.01),
+        nagiosplugin.ScalarContext("delay"),
+    )
+    check()
+    assert check.state == nagiosplugin.Unknown
+    assert [r.hint for r in check.results.most_significant] == [
+        "Deadline reached before slow could be probed"
+    ]
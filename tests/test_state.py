@@ -0,0 +1,300 @@
+from pathlib import Path
+
+import nagiosplugin
+import pytest
+from click.testing import CliRunner
+
+from check_patroni.cli import main
+from check_patroni.state import CapabilityStore, EndpointsState, RateLimiter
+from check_patroni.types import Deadline
+
+from . import PatroniAPI
+
+
+def test_state_endpoints_order(tmp_path: Path) -> None:
+    state = EndpointsState(str(tmp_path))
+    endpoints = ["http://failed", "http://slow", "http://unknown", "http://fast"]
+    assert state.plan(endpoints) == endpoints
+
+    state.record("http://failed", False, 0.1)
+    state.record("http://slow", True, 0.5)
+    state.record("http://fast", True, 0.01)
+    assert state.plan(endpoints) == [
+        "http://fast",
+        "http://slow",
+        "http://unknown",
+        "http://failed",
+    ]
+
+
+def test_state_endpoints_last_good_first(
+    runner: CliRunner, patroni_api: PatroniAPI, tmp_path: Path
+) -> None:
+    endpoints = ["http://127.0.0.1:1", patroni_api.endpoint]
+    with patroni_api.routes({"patroni": "node_is_pending_restart_ok.json"}):
+        result = runner.invoke(
+            main,
+            ["-e", ",".join(endpoints), "--state-dir", str(tmp_path)]
+            + ["node_is_pending_restart"],
+        )
+    assert result.exit_code == 0
+    assert (tmp_path / "endpoints.state").exists()
+    assert EndpointsState(str(tmp_path)).plan(endpoints) == endpoints[::-1]
+
+
+def test_state_endpoints_single_write(
+    runner: CliRunner,
+    patroni_api: PatroniAPI,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    commits = []
+    commit = nagiosplugin.Cookie.commit
+
+    def counted(cookie: nagiosplugin.Cookie) -> None:
+        commits.append(Path(cookie.path).name)
+        commit(cookie)
+
+    monkeypatch.setattr(nagiosplugin.Cookie, "commit", counted)
+    endpoints = ["http://127.0.0.1:1", patroni_api.endpoint]
+    with patroni_api.routes({"patroni": "node_is_pending_restart_ok.json"}):
+        result = runner.invoke(
+            main,
+            ["-e", ",".join(endpoints), "--state-dir", str(tmp_path)]
+            + ["node_is_pending_restart"],
+        )
+    assert result.exit_code == 0
+    # the outcomes of the two queries are stored at once
+    assert commits.count("endpoints.state") == 1
+    assert EndpointsState(str(tmp_path)).plan(endpoints) == endpoints[::-1]
+
+
+def test_state_endpoints_breaker(tmp_path: Path) -> None:
+    state = EndpointsState(str(tmp_path), breaker_threshold=2, breaker_cooldown=60)
+    endpoints = ["http://dead", "http://alive"]
+
+    state.record("http://alive", True, 0.01)
+    state.record("http://dead", False, 0.1)
+    state.commit()
+    assert state.plan(endpoints) == ["http://alive", "http://dead"]
+
+    # the breaker opens after the second failure
+    state.record("http://dead", False, 0.1)
+    state.commit()
+    assert state.plan(endpoints) == ["http://alive"]
+
+    # once the cool-down is over, a single trial is allowed, first
+    with nagiosplugin.Cookie(str(tmp_path / "endpoints.state")) as cookie:
+        cookie["http://dead"]["open_until"] = 0
+    assert state.plan(endpoints) == ["http://dead", "http://alive"]
+    assert state.plan(endpoints) == ["http://alive"]
+
+
+def test_state_endpoints_breaker_trial(
+    runner: CliRunner, patroni_api: PatroniAPI, tmp_path: Path
+) -> None:
+    # two names of the same server: the one on trial answers again
+    trial = f"http://127.0.0.1:{patroni_api.server_port}"
+    endpoints = [patroni_api.endpoint, trial]
+    state = EndpointsState(str(tmp_path), breaker_threshold=1)
+    state.record(patroni_api.endpoint, True, 0.01)
+    state.record(trial, False, 0.1)
+    state.commit()
+    with nagiosplugin.Cookie(str(tmp_path / "endpoints.state")) as cookie:
+        cookie[trial]["open_until"] = 0
+
+    with patroni_api.routes({"patroni": "node_is_pending_restart_ok.json"}):
+        result = runner.invoke(
+            main,
+            ["-e", ",".join(endpoints), "--state-dir", str(tmp_path)]
+            + ["--breaker-threshold", "1", "node_is_pending_restart"],
+        )
+    assert result.exit_code == 0
+    # the successful trial closed the breaker
+    with nagiosplugin.Cookie(str(tmp_path / "endpoints.state")) as cookie:
+        assert cookie[trial]["ok"] and cookie[trial]["failures"] == 0
+
+
+def test_state_endpoints_breaker_all_open(
+    runner: CliRunner, patroni_api: PatroniAPI, tmp_path: Path
+) -> None:
+    state = EndpointsState(str(tmp_path), breaker_threshold=1, breaker_cooldown=60)
+    state.record(patroni_api.endpoint, False, 0.1)
+    state.commit()
+    sent = len(patroni_api.requests)
+
+    with patroni_api.routes({"patroni": "node_is_pending_restart_ok.json"}):
+        result = runner.invoke(
+            main,
+            ["-e", patroni_api.endpoint, "--state-dir", str(tmp_path)]
+            + ["--breaker-threshold", "1", "node_is_pending_restart"],
+        )
+    assert result.exit_code == 3
+    assert "circuit open for all endpoints, retry in 60s" in result.stdout
+    assert len(patroni_api.requests) == sent
+
+
+def test_state_endpoints_commit(tmp_path: Path) -> None:
+    state = EndpointsState(str(tmp_path))
+    endpoints = ["http://failed", "http://alive"]
+    state.record("http://failed", False, 0.1)
+    state.record("http://alive", True, 0.01)
+    # the outcomes are known before they are stored
+    assert state.plan(endpoints) == endpoints[::-1]
+    assert EndpointsState(str(tmp_path)).plan(endpoints) == endpoints
+
+    state.commit()
+    assert EndpointsState(str(tmp_path)).plan(endpoints) == endpoints[::-1]
+
+
+def test_state_endpoints_max_age(tmp_path: Path) -> None:
+    state = EndpointsState(str(tmp_path), breaker_threshold=2)
+    endpoints = ["http://failed", "http://alive"]
+    state.record("http://failed", False, 0.1)
+    state.record("http://alive", True, 0.01)
+    state.commit()
+    assert state.plan(endpoints) == endpoints[::-1]
+
+    with nagiosplugin.Cookie(str(tmp_path / "endpoints.state")) as cookie:
+        for stat in cookie.data.values():
+            stat["at"] -= state.max_age + 1
+    # the old outcomes are unknown
+    assert state.plan(endpoints) == endpoints
+    # and the old failure doesn't count for the breaker
+    state.record("http://failed", False, 0.1)
+    state.commit()
+    assert state.plan(endpoints) == endpoints[::-1]
+
+
+def test_state_endpoints_expected_latency(tmp_path: Path) -> None:
+    state = EndpointsState(str(tmp_path))
+    for latency in (0.1, 0.2, 0.3, 0.4):
+        state.record("http://slow", True, latency)
+    state.plan(["http://slow"])
+    assert state.expected_latency("http://slow") is None
+
+    state.record("http://slow", True, 1.0)
+    state.record("http://slow", False, 2.0)
+    state.plan(["http://slow"])
+    assert state.expected_latency("http://slow") == 1.0
+
+
+def test_state_adaptive_timeout() -> None:
+    deadline = Deadline(10)
+    # without history, the time left is shared between the attempts
+    timeout = deadline.attempt_timeout(3)
+    assert timeout is not None and 2.9 < sum(timeout) <= 3
+    # a slow but alive endpoint gets several times its latency
+    timeout = deadline.attempt_timeout(3, 2.0)
+    assert timeout is not None and sum(timeout) == pytest.approx(6.0)
+    # but not more than the time left
+    timeout = deadline.attempt_timeout(3, 5.0)
+    assert timeout is not None and 8.9 < sum(timeout) <= 9
+
+
+def test_state_capabilities(tmp_path: Path) -> None:
+    store = CapabilityStore(str(tmp_path), 60)
+    endpoints = ["http://node1", "http://node2"]
+    assert store.lookup(endpoints) is None
+
+    store.observe("http://node2", "3.0.0")
+    capabilities = store.lookup(endpoints)
+    assert capabilities is not None
+    assert capabilities["version"] == "3.0.0"
+    assert not capabilities["features"]["detailed_states"]
+
+    # a new version replaces the capabilities
+    store.observe("http://node2", "3.1.0")
+    capabilities = store.lookup(endpoints)
+    assert capabilities is not None
+    assert capabilities["features"]["detailed_states"]
+
+    store.ttl = -1
+    assert store.lookup(endpoints) is None
+
+
+def test_state_capabilities_cluster_check(
+    runner: CliRunner, patroni_api: PatroniAPI, tmp_path: Path
+) -> None:
+    args = ["-e", patroni_api.endpoint, "--state-dir", str(tmp_path)]
+    with patroni_api.routes(
+        {
+            "cluster": "cluster_node_count_ok.json",
+            "patroni": "cluster_has_replica_patroni_verion_3.1.0.json",
+        }
+    ):
+        result = runner.invoke(main, args + ["cluster_node_count"])
+    assert result.exit_code == 0
+
+    # /patroni isn't queried anymore
+    with patroni_api.routes({"cluster": "cluster_node_count_ok.json"}):
+        result = runner.invoke(main, args + ["cluster_node_count"])
+    assert (
+        result.stdout
+        == "CLUSTERNODECOUNT OK - members is 3 | healthy_members=3 members=3 role_leader=1 role_replica=2 state_running=1 state_streaming=2\n"
+    )
+    assert result.exit_code == 0
+
+
+def test_state_rate_limiter(tmp_path: Path) -> None:
+    limiter = RateLimiter(str(tmp_path), 1, 2)
+    assert limiter.acquire("http://node1", 0) == 0
+    assert limiter.acquire("http://node1", 0) == 0
+    # the bucket is empty, the next token is available in a second
+    assert limiter.acquire("http://node1", 0.5) is None
+    wait = limiter.acquire("http://node1", 5)
+    assert wait is not None and 0.9 < wait <= 1
+    assert limiter.acquire("http://node2", 0) == 0
+
+
+def test_state_rate_limit_wait(
+    runner: CliRunner, patroni_api: PatroniAPI, tmp_path: Path
+) -> None:
+    args = ["-e", patroni_api.endpoint, "--state-dir", str(tmp_path)]
+    args += ["--rate-limit", "20", "--rate-burst", "1", "node_is_pending_restart"]
+    with patroni_api.routes({"patroni": "node_is_pending_restart_ok.json"}):
+        result = runner.invoke(main, args)
+        assert result.exit_code == 0
+        result = runner.invoke(main, args)
+    assert result.exit_code == 0
+    assert f"Rate limit of {patroni_api.endpoint} reached, waited" in result.stdout
+
+
+def test_state_rate_limit_race(
+    runner: CliRunner, patroni_api: PatroniAPI, tmp_path: Path
+) -> None:
+    # two names of the same server, the first one has no token left
+    endpoints = [patroni_api.endpoint, f"http://127.0.0.1:{patroni_api.server_port}"]
+    assert RateLimiter(str(tmp_path), 20, 1).acquire(endpoints[0], None) == 0
+    args = ["-e", ",".join(endpoints), "--state-dir", str(tmp_path), "--fan-out", "2"]
+    args += ["--rate-limit", "20", "--rate-burst", "1", "node_is_pending_restart"]
+    with patroni_api.routes({"patroni": "node_is_pending_restart_ok.json"}):
+        result = runner.invoke(main, args)
+    assert result.exit_code == 0
+    # the concurrent queries don't wait for the rate limiter
+    assert "waited" not in result.stdout
+
+
+def test_state_rate_limit_cached(
+    runner: CliRunner, patroni_api: PatroniAPI, tmp_path: Path
+) -> None:
+    args = ["-e", patroni_api.endpoint, "--state-dir", str(tmp_path)]
+    args += ["--rate-limit", "0.01", "--rate-burst", "1", "node_is_pending_restart"]
+    with patroni_api.routes({"patroni": "node_is_pending_restart_ok.json"}):
+        result = runner.invoke(main, args)
+    assert result.exit_code == 0
+
+    result = runner.invoke(main, args)
+    assert result.stdout.startswith(
+        "NODEISPENDINGRESTART OK - This node doesn't have the pending restart flag. | is_pending_restart=0;;0\n"
+        "Rate limit of the API reached, using the response to patroni cached"
+    )
+    assert result.exit_code == 0
+
+    (tmp_path / "responses").rename(tmp_path / "old")
+    result = runner.invoke(main, args)
+    assert (
+        result.stdout
+        == "NODEISPENDINGRESTART UNKNOWN - Connection failed or rate limit reached for all provided endpoints\n"
+    )
+    assert result.exit_code == 3
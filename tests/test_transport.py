@@ -0,0 +1,164 @@
+import ssl
+from pathlib import Path
+from typing import Any, Iterator
+
+import pytest
+import requests
+from click.testing import CliRunner
+
+from check_patroni.cli import main
+from check_patroni.transport import (
+    HTTPSConnection,
+    RequestsTransport,
+    StdlibTransport,
+    TransportName,
+    get_transport,
+    pool_key,
+    ssl_context,
+)
+
+from . import PatroniAPI
+
+
+@pytest.fixture(params=["requests", "stdlib"])
+def transport(request: Any) -> Any:
+    return request.param
+
+
+@pytest.fixture
+def node_is_replica_ok(patroni_api: PatroniAPI) -> Iterator[None]:
+    with patroni_api.routes({"replica": "node_is_replica_ok.json"}):
+        yield None
+
+
+@pytest.mark.usefixtures("node_is_replica_ok")
+def test_transport_node_is_replica_ok(
+    runner: CliRunner, patroni_api: PatroniAPI, transport: str
+) -> None:
+    result = runner.invoke(
+        main,
+        [
+            "-e",
+            patroni_api.endpoint,
+            "--transport",
+            transport,
+            "node_is_replica",
+            "--max-lag",
+            "100",
+        ],
+    )
+    assert (
+        result.stdout
+        == "NODEISREPLICA OK - This node is a running replica with no noloadbalance tag and the lag is under 100. | is_replica=1;;@0\n"
+    )
+    assert result.exit_code == 0
+
+
+def test_transport_node_is_replica_ko(
+    runner: CliRunner, patroni_api: PatroniAPI, transport: str
+) -> None:
+    result = runner.invoke(
+        main, ["-e", patroni_api.endpoint, "--transport", transport, "node_is_replica"]
+    )
+    assert (
+        result.stdout
+        == "NODEISREPLICA CRITICAL - This node is not a running replica with no noloadbalance tag. | is_replica=0;;@0\n"
+    )
+    assert result.exit_code == 2
+
+
+def test_transport_connection_failed(runner: CliRunner, transport: str) -> None:
+    result = runner.invoke(
+        main,
+        ["-e", "http://127.0.0.1:1", "--transport", transport, "node_is_replica"],
+    )
+    assert (
+        result.stdout
+        == "NODEISREPLICA UNKNOWN - Connection failed for all provided endpoints\n"
+    )
+    assert result.exit_code == 3
+
+
+def test_transport_tls(
+    runner: CliRunner, patroni_api_tls: PatroniAPI, tlsdir: Path, transport: str
+) -> None:
+    with patroni_api_tls.routes({"replica": "node_is_replica_ok.json"}):
+        result = runner.invoke(
+            main,
+            [
+                "-e",
+                patroni_api_tls.endpoint,
+                "--ca_file",
+                str(tlsdir / "server.crt"),
+                "--transport",
+                transport,
+                "node_is_replica",
+            ],
+        )
+    assert result.exit_code == 0
+
+
+def test_transport_tls_requests_ca_bundle(
+    patroni_api_tls: PatroniAPI, tlsdir: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    url = f"{patroni_api_tls.endpoint}/replica"
+    with patroni_api_tls.routes({"replica": "node_is_replica_ok.json"}):
+        # without CA file, requests' CA bundle is used
+        with pytest.raises(requests.exceptions.SSLError):
+            RequestsTransport().get(url, None, None, None)
+        monkeypatch.setenv("REQUESTS_CA_BUNDLE", str(tlsdir / "server.crt"))
+        assert RequestsTransport().get(url, None, None, None).status_code == 200
+
+
+def test_transport_tls_ca_file_only(
+    patroni_api_tls: PatroniAPI, tlsdir: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    url = f"{patroni_api_tls.endpoint}/replica"
+    ca_file = requests.utils.DEFAULT_CA_BUNDLE_PATH
+    context = ssl_context(None, ca_file)
+    ca_count = context.cert_store_stats()["x509_ca"]
+    monkeypatch.setenv("REQUESTS_CA_BUNDLE", str(tlsdir / "server.crt"))
+    with patroni_api_tls.routes({"replica": "node_is_replica_ok.json"}):
+        # the CA of the environment isn't trusted when a CA file is given
+        with pytest.raises(requests.exceptions.SSLError):
+            RequestsTransport().get(url, None, ca_file, None)
+        with pytest.raises(ssl.SSLError):
+            StdlibTransport().get(url, None, ca_file, None)
+    # nor added to the cached context
+    assert context.cert_store_stats()["x509_ca"] == ca_count
+
+
+def test_transport_tls_ssl_context_cached(tlsdir: Path) -> None:
+    ca_cert = str(tlsdir / "server.crt")
+    context = ssl_context(None, ca_cert)
+    assert ssl_context(None, ca_cert) is context
+    assert ssl_context(None, None) is not context
+
+
+def test_transport_tls_session_resumption(
+    patroni_api_tls: PatroniAPI, tlsdir: Path
+) -> None:
+    transport = StdlibTransport()
+    url = f"{patroni_api_tls.endpoint}/replica"
+    ca_cert = str(tlsdir / "server.crt")
+    key = pool_key(url, None, ca_cert)
+    with patroni_api_tls.routes({"replica": "node_is_replica_ok.json"}):
+        # the fake API closes the connection after each request, the second
+        # request needs a new connection
+        transport.get(url, None, ca_cert, None)
+        transport.get(url, None, ca_cert, None)
+    (conn,) = transport._idle[key]
+    assert isinstance(conn, HTTPSConnection)
+    assert conn.session_reused
+
+
+@pytest.mark.usefixtures("node_is_replica_ok")
+def test_transport_get(patroni_api: PatroniAPI, transport: TransportName) -> None:
+    shared = get_transport(transport)
+    assert get_transport(transport) is shared
+    # the transports answer alike, whatever the status code
+    r = shared.get(f"{patroni_api.endpoint}/replica", None, None, (1, 1))
+    assert r.status_code == 200
+    assert r.json()["role"] == "replica"
+    r = shared.get(f"{patroni_api.endpoint}/nope", None, None, (1, 1))
+    assert r.status_code == 404